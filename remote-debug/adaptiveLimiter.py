@@ -0,0 +1,236 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+from metrics import METRICS
+
+# SharePoint 限流时返回的状态码
+THROTTLE_STATUSES = (429, 503)
+
+
+class ThrottledError(Exception):
+    """服务器返回 429/503 (限流)。retry_after 为 Retry-After 头给出的等待秒数 (可能为 None)。"""
+
+    def __init__(self, status: int, retry_after: float | None = None):
+        super().__init__(f"被服务器限流 (HTTP {status})" + (f"，Retry-After {retry_after:.0f} 秒" if retry_after else ""))
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After 头：既可能是秒数，也可能是 HTTP 日期。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpStatusError(RuntimeError):
+    """非限流的 HTTP 错误状态码 (如删除回发返回 4xx/5xx)。status 供 is_congestion 区分 5xx。"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def is_congestion(exc: BaseException) -> bool:
+    """
+    超时与 5xx 视为服务端过载信号 (限流由 ThrottledError 单独处理)；
+    404、链接失效、页面中找不到 deleteOnClick 等只与单个链接有关的错误不是。
+    """
+    # asyncio / aiohttp 的超时都是内置 TimeoutError 的子类；Playwright 的超时异常同名但不是
+    if isinstance(exc, TimeoutError) or type(exc).__name__ == 'TimeoutError':
+        return True
+    status = getattr(exc, 'status', None)  # aiohttp.ClientResponseError、HttpStatusError
+    return isinstance(status, int) and status >= 500
+
+
+def check_throttled(status: int, headers) -> None:
+    """若状态码表示限流则抛出 ThrottledError。headers 为任意支持 .get() 的响应头映射。"""
+    if status in THROTTLE_STATUSES:
+        raise ThrottledError(status, parse_retry_after(headers.get('retry-after') or headers.get('Retry-After')))
+
+
+# --- AIMD 自适应并发控制器 ---
+class AdaptiveLimiter:
+    """
+    AIMD (加性增、乘性减) 自适应并发控制，取代固定的 Semaphore(15)。
+
+    - 每完成一个窗口 (当前并发数个请求，至少 min_window 个，避免并发较低时一次错误就超过 max_error_rate)：
+      错误率与延迟都健康则并发 +1。
+    - 连续两个窗口的过载错误率 (超时与 5xx，见 is_congestion) 超过 max_error_rate，或窗口平均延迟超过历史最佳的
+      latency_tolerance 倍：并发乘以 backoff。与负载无关的零星 5xx 很少连续两个窗口超限，持续过载则必然如此。
+    - 只与单个链接有关的错误 (404、链接失效、页面解析失败等) 不计入窗口，不影响并发，只计入熔断。
+    - 遇到限流 (ThrottledError)：立即乘性减小，并在 Retry-After (或 default_pause) 秒内暂停发放新的并发名额。
+    - 熔断：最近 breaker_window 个请求 (不含限流，含所有错误) 的失败率达到 breaker_threshold 时，
+      所有 worker 暂停 breaker_cooldown 秒，之后从最小并发重新开始。
+    - 限流或熔断暂停结束后快速恢复：健康窗口内并发翻倍，直到回到暂停前的水平，之后再恢复为 +1。
+
+    用法：
+        limiter = AdaptiveLimiter(initial=4, max_limit=15)
+        async with limiter.slot():
+            ...  # 抛出 ThrottledError 视为限流，其他异常视为错误 (其中超时与 5xx 视为过载)
+    """
+
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 15, max_error_rate: float = 0.1,
+                 latency_tolerance: float = 2.0, backoff: float = 0.5, default_pause: float = 10.0,
+                 breaker_window: int = 20, breaker_threshold: float = 0.5, breaker_cooldown: float = 30.0,
+                 min_window: int = 20):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.max_error_rate = max_error_rate
+        self.latency_tolerance = latency_tolerance
+        self.backoff = backoff
+        self.default_pause = default_pause
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.min_window = min_window
+
+        self.in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+        self.errors = 0
+        self.breaker_trips = 0
+        self._paused_until = 0.0
+        self._recovery_target = 0.0  # 暂停前的并发，恢复阶段翻倍增长直到该值
+        self._outcomes: deque[bool] = deque(maxlen=breaker_window)  # 最近请求是否失败 (熔断判断)
+        self._best_latency: float | None = None
+        self._window_latencies: list[float] = []
+        self._window_errors = 0
+        self._error_windows = 0  # 连续错误率超限的窗口数
+        self._recent: deque[float] = deque()  # 最近完成时间，用于计算吞吐
+        self._cond = asyncio.Condition()
+        self._publish()
+
+    @property
+    def current_limit(self) -> int:
+        return int(self.limit)
+
+    def throughput(self, period: float = 10.0) -> float:
+        """最近 period 秒内每秒完成的请求数。"""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > period:
+            self._recent.popleft()
+        return len(self._recent) / period
+
+    def status_text(self) -> str:
+        return (f"并发 {self.current_limit}/{self.max_limit} 进行中 {self.in_flight} "
+                f"吞吐 {self.throughput():.2f}/秒 限流 {self.throttled} 次"
+                + (f" 熔断 {self.breaker_trips} 次" if self.breaker_trips else ""))
+
+    async def acquire(self):
+        while True:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            async with self._cond:
+                if self._paused_until > time.monotonic():
+                    continue
+                if self.in_flight < self.current_limit:
+                    self.in_flight += 1
+                    self._publish()
+                    return
+                await self._cond.wait()
+
+    async def release(self, latency: float, error: bool = False, throttled: bool = False,
+                      retry_after: float | None = None, congestion: bool = False):
+        """congestion: 该错误是否为过载信号 (计入窗口错误率)；error 为任意失败 (计入熔断)。"""
+        async with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            self._recent.append(time.monotonic())
+
+            if throttled:
+                self.throttled += 1
+                METRICS.inc('throttled')
+                self._pause(retry_after if retry_after is not None else self.default_pause)
+                self._decrease()
+            else:
+                self.errors += int(error)
+                if not error or congestion:
+                    self._window_errors += int(error)
+                    self._window_latencies.append(latency)
+                self._outcomes.append(error)
+                if self._breaker_tripped():
+                    self._trip_breaker()
+                elif len(self._window_latencies) >= max(self.current_limit, self.min_window):
+                    self._evaluate_window()
+            self._publish()
+            self._cond.notify_all()
+
+    def _publish(self):
+        """把当前并发上限与进行中的请求数写入指标 (进度摘要与 Prometheus 端点)。"""
+        METRICS.set('concurrency_limit', self.current_limit)
+        METRICS.set('in_flight', self.in_flight)
+
+    def _evaluate_window(self):
+        count = len(self._window_latencies)
+        error_rate = self._window_errors / count
+        average = sum(self._window_latencies) / count
+        if self._best_latency is None or average < self._best_latency:
+            self._best_latency = average
+        self._error_windows = self._error_windows + 1 if error_rate > self.max_error_rate else 0
+        if self._error_windows >= 2 or average > self._best_latency * self.latency_tolerance:
+            self._error_windows = 0
+            self._decrease()
+        elif not self._error_windows:  # 只有一个窗口超限时不增加并发，等下一个窗口确认
+            if self.limit < self._recovery_target:
+                self.limit = min(self._recovery_target, self.max_limit, self.limit * 2)
+            else:
+                self._recovery_target = 0.0
+                self.limit = min(self.max_limit, self.limit + 1)
+        self._reset_window()
+
+    def _decrease(self):
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def _pause(self, seconds: float):
+        """暂停发放新的并发名额，并记下暂停前的并发，供恢复阶段快速回升。"""
+        self._recovery_target = max(self._recovery_target, self.limit)
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._reset_window()
+
+    def _breaker_tripped(self) -> bool:
+        return (len(self._outcomes) == self._outcomes.maxlen
+                and sum(self._outcomes) / len(self._outcomes) >= self.breaker_threshold)
+
+    def _trip_breaker(self):
+        failure_rate = sum(self._outcomes) / len(self._outcomes)
+        self.breaker_trips += 1
+        METRICS.inc('breaker_trips')
+        print(f"[熔断] 最近 {len(self._outcomes)} 个请求失败率 {failure_rate:.0%}，"
+              f"所有 worker 暂停 {self.breaker_cooldown:g} 秒后从并发 {self.min_limit} 重新开始。")
+        self._pause(self.breaker_cooldown)
+        self.limit = float(self.min_limit)
+        self._outcomes.clear()
+
+    def _reset_window(self):
+        self._window_latencies = []
+        self._window_errors = 0
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """获取一个并发名额，退出时根据耗时与异常类型反馈给控制器。"""
+        with METRICS.phase('limiter_wait'):
+            await self.acquire()
+        start_time = time.perf_counter()
+        try:
+            yield
+        except ThrottledError as e:
+            await self.release(time.perf_counter() - start_time, throttled=True, retry_after=e.retry_after)
+            raise
+        except BaseException as e:
+            await self.release(time.perf_counter() - start_time, error=True, congestion=is_congestion(e))
+            raise
+        else:
+            await self.release(time.perf_counter() - start_time)
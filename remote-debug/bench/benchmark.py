@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+
+import aiohttp
+from playwright.async_api import async_playwright
+
+from adaptiveLimiter import AdaptiveLimiter
+from bench.mockSharePoint import ROOT_FOLDER, add_library_arguments, build_mock, start_mock_server, storman_url, \
+    versions_url
+from browserSession import PagePool
+from collectHistoryUrls import get_feature_links
+from delHistory import feed_links, iter_async, open_link_and_trigger_delete, post_delete_over_http, precheck_versions, \
+    run_delete_workers
+from metrics import METRICS
+from retryPolicy import RetryPolicy
+
+try:
+    import psutil
+except ImportError:  # 未安装 psutil 时退回到 resource (只统计 Python 进程，不含浏览器)
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+
+# --- 内存与标签页采样 ---
+class ResourceSampler:
+    """
+    定期采样本进程及其子进程 (浏览器) 的 RSS 与打开的标签页数量，记录峰值。
+    需要 psutil 才能统计浏览器进程；否则只能给出 Python 进程自身的峰值 RSS。
+    """
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_tabs = 0
+        self._process = psutil.Process() if psutil is not None else None
+        self._task = None
+
+    def _rss(self) -> int:
+        if self._process is None:
+            return 0
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            with contextlib.suppress(psutil.Error):
+                total += child.memory_info().rss
+        return total
+
+    def sample(self):
+        self.peak_rss = max(self.peak_rss, self._rss())
+        self.peak_tabs = max(self.peak_tabs, int(METRICS.gauges.get('tabs_open', 0)))
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.sample()
+        if self._process is None and resource is not None:
+            # ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+            scale = 1 if sys.platform == 'darwin' else 1024
+            self.peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+# --- 单项基准 ---
+async def bench_crawl(base_url: str, concurrency: int, page_pool: PagePool, http_session, limiter) -> dict:
+    """从模拟站点根目录爬取全部“版本历史记录”链接 (输出写入空设备)。"""
+    pages_before = METRICS.counters.get('pages_crawled', 0)
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as sink:
+        links = await get_feature_links(base_url + storman_url(ROOT_FOLDER), page_pool, sink, asyncio.Lock(),
+                                        concurrency, None, http_session, limiter)
+    elapsed = time.perf_counter() - start
+    pages = METRICS.counters.get('pages_crawled', 0) - pages_before
+    return {'phase': 'crawl', 'seconds': round(elapsed, 3), 'pages': pages, 'links': links,
+            'pages_per_s': round(pages / elapsed, 2), 'links_per_s': round(links / elapsed, 2)}
+
+
+async def bench_delete(base_url: str, mock, concurrency: int, page_pool: PagePool, http_session, limiter,
+                       policy: RetryPolicy, check_session=None) -> dict:
+    """
+    对模拟站点中的每个文件执行一次“删除所有版本”。
+    提供 check_session 时先预检查，跳过只有当前版本的文件 (见 --clean-ratio)。
+    """
+    links = [base_url + versions_url(item_id, item) for item_id, item in mock.library.items.items()]
+    counter_lock = asyncio.Lock()
+    clean_before = METRICS.counters.get('links_clean', 0)
+
+    async def process_link(url, index):
+        if http_session is not None:
+            return await post_delete_over_http(url, http_session, index, counter_lock, limiter,
+                                               skip_clean=check_session is not None)
+        if check_session is not None:
+            versions, _ = await precheck_versions(url, check_session, limiter)
+            if not versions:
+                METRICS.inc('links_clean')
+                return 1
+        return await open_link_and_trigger_delete(url, page_pool, index, counter_lock, limiter, policy=policy)
+
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    start = time.perf_counter()
+    feeder = asyncio.create_task(feed_links(iter_async(links), queue, concurrency))
+    processed = await run_delete_workers(queue, concurrency, process_link)
+    await feeder
+    elapsed = time.perf_counter() - start
+    return {'phase': 'delete', 'seconds': round(elapsed, 3), 'links': len(links), 'deleted': processed,
+            'skipped_clean': int(METRICS.counters.get('links_clean', 0) - clean_before),
+            'links_per_s': round(processed / elapsed, 2)}
+
+
+# --- 主函数 ---
+async def main(args):
+    mock = build_mock(args)
+    runner, base_url = await start_mock_server(mock)
+    print(f"模拟站点: {base_url}{storman_url(ROOT_FOLDER)} "
+          f"({len(mock.library.folders)} 个文件夹，{len(mock.library.items)} 个文件)")
+
+    limiter = AdaptiveLimiter(args.initial_concurrency or args.concurrency, 1, args.concurrency)
+    sampler = ResourceSampler()
+    results = []
+    try:
+        async with async_playwright() as p:
+            browser = None
+            page_pool = None
+            http_session = None
+            check_session = None
+            if args.backend == 'http':
+                http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency))
+            else:
+                browser = await p.chromium.launch(headless=not args.headed)
+                page_pool = PagePool(await browser.new_context(), args.concurrency)
+            if args.precheck:
+                check_session = http_session or aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=args.concurrency))
+            sampler.start()
+            try:
+                # 爬虫与删除 worker 每处理一个页面都会打印一行，基准测试时默认丢弃这些输出
+                with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+                        contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                    if args.phase in ('crawl', 'all'):
+                        results.append(await bench_crawl(base_url, args.concurrency, page_pool, http_session,
+                                                         limiter))
+                    if args.phase in ('delete', 'all'):
+                        results.append(await bench_delete(base_url, mock, args.concurrency, page_pool, http_session,
+                                                          limiter, RetryPolicy(delete_timeout=args.delete_timeout),
+                                                          check_session))
+            finally:
+                await sampler.stop()
+                if page_pool is not None:
+                    await page_pool.close()
+                if browser is not None:
+                    await browser.close()
+                if http_session is not None:
+                    await http_session.close()
+                if check_session is not None and check_session is not http_session:
+                    await check_session.close()
+    finally:
+        await runner.cleanup()
+
+    summary = {
+        'backend': args.backend,
+        'concurrency': args.concurrency,
+        'results': results,
+        'peak_rss_mb': round(sampler.peak_rss / 1024 / 1024, 1) if sampler.peak_rss else None,
+        'peak_tabs': sampler.peak_tabs,
+        'tabs_created': page_pool.created if page_pool is not None else 0,
+        'server': dict(mock.stats),
+        'limiter': limiter.status_text(),
+    }
+    print(f"\n后端 {args.backend}，并发 {args.concurrency}")
+    for result in results:
+        if result['phase'] == 'crawl':
+            print(f"爬取: {result['pages']} 个页面，{result['links']} 个链接，用时 {result['seconds']} 秒 "
+                  f"({result['pages_per_s']} 页/秒，{result['links_per_s']} 链接/秒)")
+        else:
+            print(f"删除: {result['deleted']}/{result['links']} 个链接 (预检查跳过 {result['skipped_clean']} 个)，"
+                  f"用时 {result['seconds']} 秒 ({result['links_per_s']} 链接/秒)")
+    rss = f"{summary['peak_rss_mb']} MB" if summary['peak_rss_mb'] else '未知'
+    print(f"峰值 RSS: {rss}{'' if psutil is not None else ' (未安装 psutil，不含浏览器进程)'}，"
+          f"峰值标签页: {summary['peak_tabs']}，共创建标签页: {summary['tabs_created']}")
+    print(f"服务器统计: {summary['server']}")
+    print(f"阶段耗时: {METRICS.summary_text()}")
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(summary, ensure_ascii=False) + '\n')
+        print(f"结果已追加到 {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='在本地模拟站点上对爬取与删除进行基准测试 (在 remote-debug 目录下运行 '
+                                                 'python -m bench.benchmark)')
+    parser.add_argument('phase', nargs='?', choices=['crawl', 'delete', 'all'], default='all', help='测试项目')
+    parser.add_argument('--backend', choices=['playwright', 'http'], default='playwright', help='爬取与删除使用的后端')
+    parser.add_argument('--concurrency', type=int, default=15, help='并发数量 (标签页池大小)')
+    parser.add_argument('--initial-concurrency', type=int, help='初始并发 (默认与 --concurrency 相同，即固定并发)')
+    parser.add_argument('--delete-timeout', type=float, default=30.0, help='等待删除回发完成的超时时间 (秒)')
+    parser.add_argument('--precheck', action='store_true', help='删除前预检查版本页面，跳过只有当前版本的文件')
+    parser.add_argument('--headed', action='store_true', help='显示浏览器窗口 (默认无头)')
+    parser.add_argument('--verbose', action='store_true', help='保留爬虫与删除 worker 的逐条输出')
+    parser.add_argument('--json', help='把结果以 JSON 行追加到此文件，便于比较多次运行')
+    add_library_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import random
+from html import escape
+from urllib.parse import quote
+
+from aiohttp import web
+
+from stormanRows import FEATURE_LINK_TEXT, format_size
+
+SITE_PATH = '/sites/bench'
+LIST_GUID = '{6F1D2A3B-0C4E-4B5A-9D8E-7F6A5B4C3D2E}'
+ROOT_FOLDER = 'Shared Documents'
+MB = 1024 * 1024
+
+
+# --- 合成的文档库目录树 ---
+class SyntheticLibrary:
+    """
+    按 depth / fanout / files_per_folder 生成一棵确定性的目录树 (相同 seed 生成相同的树)。
+
+    - 每个文件夹有 fanout 个子文件夹 (深度达到 depth 的文件夹没有子文件夹) 和 files_per_folder 个文件。
+    - 每个文件有 1~max_versions 个版本；clean_ratio 比例的文件只有当前版本 (无可删除的历史版本)。
+    """
+
+    def __init__(self, depth: int = 3, fanout: int = 4, files_per_folder: int = 20, max_versions: int = 5,
+                 clean_ratio: float = 0.0, seed: int = 0):
+        rng = random.Random(seed)
+        self.folders: dict[str, list[tuple[str, str]]] = {}  # 文件夹路径 -> [(类型, 子项路径或文件 ID)]
+        self.items: dict[int, dict] = {}  # 文件 ID -> {'path', 'size', 'versions'}
+        pending = [(ROOT_FOLDER, 0)]
+        while pending:
+            path, level = pending.pop(0)
+            children = []
+            if level < depth:
+                for i in range(fanout):
+                    child = f"{path}/folder-{level + 1}-{i}"
+                    children.append(('folder', child))
+                    pending.append((child, level + 1))
+            for _ in range(files_per_folder):
+                item_id = len(self.items) + 1
+                versions = 1 if rng.random() < clean_ratio else rng.randint(2, max(2, max_versions))
+                self.items[item_id] = {
+                    'path': f"{path}/file-{item_id}.mkv",
+                    'size': rng.randint(1, 500) * MB,
+                    'versions': versions,
+                }
+                children.append(('file', str(item_id)))
+            self.folders[path] = children
+        self.refresh_folder_sizes()
+
+    def refresh_folder_sizes(self):
+        """重新计算各文件夹 (含子树) 的总大小 (页面显示用)；删除历史版本后调用，与真实站点一样向上级传播。"""
+        self.folder_sizes: dict[str, int] = dict.fromkeys(self.folders, 0)
+        for item in self.items.values():
+            folder = item['path']
+            while '/' in folder:
+                folder = folder.rsplit('/', 1)[0]
+                self.folder_sizes[folder] += item['size'] * item['versions']
+
+    def version_size(self, item: dict) -> int:
+        """历史版本 (不含当前版本) 占用的空间：假设每个历史版本与当前版本等大。"""
+        return (item['versions'] - 1) * item['size']
+
+
+def storman_url(path: str, page: int = 1) -> str:
+    url = f"{SITE_PATH}/_layouts/15/storman.aspx?root={quote(path)}"
+    return url if page == 1 else f"{url}&page={page}"
+
+
+def versions_url(item_id: int, item: dict) -> str:
+    return (f"{SITE_PATH}/_layouts/15/versions.aspx?list={quote(LIST_GUID, safe='')}&ID={item_id}"
+            f"&FileName={quote(SITE_PATH + '/' + item['path'], safe='')}")
+
+
+# --- 模拟服务器 ---
+class MockSharePoint:
+    """
+    aiohttp 实现的 storman.aspx / versions.aspx 模拟站点，用于离线基准测试。
+
+    - storman.aspx: 与真实页面相同的表格结构 (第 2 列的文件夹链接、“版本历史记录”链接、大小列)，
+      每页 page_size 行，通过“下一个”链接分页。
+    - versions.aspx: 版本列表与一个可用的 deleteOnClick()：弹窗确认后设置 __EVENTTARGET 并提交表单，
+      POST 回发后只保留当前版本。
+    - latency 为每个请求的平均注入延迟 (秒，±50% 抖动)；throttle_rate / error_rate 为返回 429 / 500 的概率。
+    """
+
+    def __init__(self, library: SyntheticLibrary, page_size: int = 50, latency: float = 0.05,
+                 throttle_rate: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.library = library
+        self.page_size = page_size
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.stats = {'storman': 0, 'versions': 0, 'postbacks': 0, 'deleted': 0, 'throttled': 0, 'errors': 0}
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get(f"{SITE_PATH}/_layouts/15/storman.aspx", self.storman)
+        app.router.add_get(f"{SITE_PATH}/_layouts/15/versions.aspx", self.versions)
+        app.router.add_post(f"{SITE_PATH}/_layouts/15/versions.aspx", self.postback)
+        return app
+
+    async def _simulate(self):
+        """注入延迟与错误。"""
+        if self.latency:
+            await asyncio.sleep(self.latency * self.rng.uniform(0.5, 1.5))
+        roll = self.rng.random()
+        if roll < self.throttle_rate:
+            self.stats['throttled'] += 1
+            raise web.HTTPTooManyRequests(headers={'Retry-After': '1'})
+        if roll < self.throttle_rate + self.error_rate:
+            self.stats['errors'] += 1
+            raise web.HTTPInternalServerError()
+
+    async def storman(self, request: web.Request) -> web.Response:
+        await self._simulate()
+        self.stats['storman'] += 1
+        path = request.query.get('root', ROOT_FOLDER)
+        page = int(request.query.get('page', '1'))
+        if path not in self.library.folders:
+            raise web.HTTPNotFound()
+        children = self.library.folders[path]
+        start = (page - 1) * self.page_size
+        rows = []
+        for kind, value in children[start:start + self.page_size]:
+            if kind == 'folder':
+                name = value.rsplit('/', 1)[-1]
+                size = format_size(self.library.folder_sizes[value])
+                rows.append(f'<tr><td><img alt="文件夹"></td><td><a href="{escape(storman_url(value))}">{escape(name)}</a>'
+                            f'</td><td>{size}</td><td></td></tr>')
+            else:
+                item_id = int(value)
+                item = self.library.items[item_id]
+                name = item['path'].rsplit('/', 1)[-1]
+                version_size = self.library.version_size(item)
+                rows.append(f'<tr><td><img alt="文件"></td><td>{escape(name)} '
+                            f'<a href="{escape(versions_url(item_id, item))}">{FEATURE_LINK_TEXT}</a></td>'
+                            f'<td>{format_size(item["size"] + version_size)}</td>'
+                            f'<td>{format_size(version_size) if version_size else ""}</td></tr>')
+        next_link = ''
+        if start + self.page_size < len(children):
+            next_link = f'<a href="{escape(storman_url(path, page + 1))}">下一个</a>'
+        html = (f'<html><head><meta charset="utf-8"><title>存储指标</title></head><body>'
+                f'<h1>{escape(path)}</h1><table><tr><th></th><th>名称</th><th>总大小</th><th>历史版本</th></tr>'
+                f'{"".join(rows)}</table>{next_link}</body></html>')
+        return web.Response(text=html, content_type='text/html', charset='utf-8')
+
+    def _item(self, request: web.Request) -> tuple[int, dict]:
+        try:
+            item_id = int(request.query['ID'])
+            return item_id, self.library.items[item_id]
+        except (KeyError, ValueError):
+            raise web.HTTPNotFound()
+
+    async def versions(self, request: web.Request) -> web.Response:
+        await self._simulate()
+        self.stats['versions'] += 1
+        return self._versions_page(request, *self._item(request))
+
+    def _versions_page(self, request: web.Request, item_id: int, item: dict) -> web.Response:
+        file_url = f"{SITE_PATH}/{item['path']}"
+        rows = [f'<tr><td>{item["versions"]}.0</td><td><a href="{escape(quote(file_url))}">当前版本</a></td>'
+                f'<td>{format_size(item["size"])}</td></tr>']
+        for version in range(item['versions'] - 1, 0, -1):
+            history_url = f"{SITE_PATH}/_vti_history/{version * 512}/{item['path']}"
+            rows.append(f'<tr><td>{version}.0</td><td><a href="{escape(quote(history_url))}">{version}.0</a></td>'
+                        f'<td>{format_size(item["size"])}</td></tr>')
+        html = f'''<html><head><meta charset="utf-8"><title>版本历史记录</title>
+<script>
+function deleteOnClick() {{
+    if (confirm("确实要删除所有以前的版本吗?")) {{
+        document.forms[0].__EVENTTARGET.value = "DeleteAllVersions";
+        document.forms[0].submit();
+    }}
+}}
+</script></head><body>
+<form method="post" action="{escape(str(request.rel_url))}">
+<input type="hidden" name="__EVENTTARGET" value="">
+<input type="hidden" name="__EVENTARGUMENT" value="">
+<input type="hidden" name="__VIEWSTATE" value="bench-viewstate-{item_id}">
+<input type="hidden" name="__REQUESTDIGEST" value="0xBENCH,{item_id}">
+<table class="ms-settingsframe">{"".join(rows)}</table>
+<a href="javascript:deleteOnClick()">删除所有版本</a>
+</form></body></html>'''
+        return web.Response(text=html, content_type='text/html', charset='utf-8')
+
+    async def postback(self, request: web.Request) -> web.Response:
+        await self._simulate()
+        self.stats['postbacks'] += 1
+        item_id, item = self._item(request)
+        form = await request.post()
+        if form.get('__EVENTTARGET') != 'DeleteAllVersions' or not form.get('__VIEWSTATE'):
+            raise web.HTTPBadRequest(text='无效的回发')
+        if item['versions'] > 1:
+            self.stats['deleted'] += 1
+            item['versions'] = 1
+            self.library.refresh_folder_sizes()
+        return self._versions_page(request, item_id, item)
+
+
+async def start_mock_server(mock: MockSharePoint, port: int = 0) -> tuple[web.AppRunner, str]:
+    """启动模拟服务器，返回 (runner, 根地址)。port 为 0 时自动选择空闲端口。"""
+    runner = web.AppRunner(mock.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def add_library_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--depth', type=int, default=3, help='目录树深度')
+    parser.add_argument('--fanout', type=int, default=4, help='每个文件夹的子文件夹数量')
+    parser.add_argument('--files', type=int, default=20, help='每个文件夹的文件数量')
+    parser.add_argument('--max-versions', type=int, default=5, help='每个文件的最大版本数')
+    parser.add_argument('--clean-ratio', type=float, default=0.0, help='只有当前版本的文件所占比例')
+    parser.add_argument('--page-size', type=int, default=50, help='storman.aspx 每页行数 (超过时分页)')
+    parser.add_argument('--latency', type=float, default=0.05, help='每个请求的平均注入延迟 (秒)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='返回 429 的概率')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 500 的概率')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子 (相同参数与种子生成相同的站点)')
+
+
+def build_mock(args: argparse.Namespace) -> MockSharePoint:
+    library = SyntheticLibrary(args.depth, args.fanout, args.files, args.max_versions, args.clean_ratio, args.seed)
+    return MockSharePoint(library, args.page_size, args.latency, args.throttle_rate, args.error_rate, args.seed)
+
+
+async def serve_forever(mock: MockSharePoint, port: int):
+    runner, base_url = await start_mock_server(mock, port)
+    print(f"模拟站点已启动: {base_url}{storman_url(ROOT_FOLDER)}")
+    print(f"共 {len(mock.library.folders)} 个文件夹，{len(mock.library.items)} 个文件。按 Ctrl+C 停止。")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='离线基准测试用的 SharePoint storman.aspx / versions.aspx 模拟站点')
+    parser.add_argument('--port', type=int, default=8765, help='监听端口 (127.0.0.1)')
+    add_library_arguments(parser)
+    args = parser.parse_args()
+    asyncio.run(serve_forever(build_mock(args), args.port))
@@ -0,0 +1,419 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import time
+import urllib.request
+from urllib.parse import urlsplit
+from playwright.async_api import async_playwright, BrowserContext, Dialog, Page, Request, Route
+
+from metrics import METRICS
+
+# --- 浏览器路径配置 (来自 thoriumDebugDemo.py) ---
+THORIUM_PATH = r"C:\Users\Administrator\AppData\Local\Thorium\Application\thorium.exe"
+CHROME_PATH = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
+
+
+# 各浏览器默认的用户数据目录 (复制登录状态的来源)
+THORIUM_USER_DATA = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Thorium', 'User Data')
+CHROME_USER_DATA = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Google', 'Chrome', 'User Data')
+
+
+def select_browser() -> tuple[str, int, str, str]:
+    """
+    优先使用 Thorium (端口 9222)，否则使用 Chrome (端口 9223)。
+
+    Returns:
+        (可执行文件路径, 默认调试端口, 浏览器名称, 默认用户数据目录)
+    """
+    if os.path.exists(THORIUM_PATH):
+        return THORIUM_PATH, 9222, "Thorium", THORIUM_USER_DATA
+    if os.path.exists(CHROME_PATH):
+        return CHROME_PATH, 9223, "Chrome", CHROME_USER_DATA
+    print(f"错误: Thorium 和 Chrome 路径均未找到。")
+    print(f"Thorium 路径: {THORIUM_PATH}")
+    print(f"Chrome 路径: {CHROME_PATH}")
+    raise FileNotFoundError("未找到 Thorium 或 Chrome 浏览器。")
+
+
+# 最小化复制时只复制登录所需的文件 (相对用户数据目录)，跳过缓存等大目录。
+# Cookies 由 Local State 中的密钥加密，二者必须一起复制。
+PROFILE_ROOT_FILES = ('Local State', 'First Run')
+PROFILE_FILES = (
+    'Cookies', 'Cookies-journal', os.path.join('Network', 'Cookies'), os.path.join('Network', 'Cookies-journal'),
+    'Login Data', 'Login Data-journal', 'Login Data For Account', 'Login Data For Account-journal',
+    'Preferences', 'Secure Preferences', 'Web Data', 'Web Data-journal', 'Local Storage',
+)
+
+
+def copy_minimal_profile(source: str, destination: str, profile: str = 'Default'):
+    """只复制 Local State 与指定配置 (默认 Default) 中与登录相关的文件和目录，缺失的文件直接跳过。"""
+    paths = [*PROFILE_ROOT_FILES, *(os.path.join(profile, name) for name in PROFILE_FILES)]
+    for relative in paths:
+        src = os.path.join(source, relative)
+        dst = os.path.join(destination, relative)
+        if os.path.isdir(src):
+            shutil.copytree(src, dst, ignore=shutil.ignore_patterns('LOCK', 'lockfile', '*.lock'))
+        elif os.path.isfile(src):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(src, dst)
+
+
+async def copy_user_data(source: str, destination: str, minimal: bool = True):
+    """
+    目标目录不存在时，从默认配置复制一份用户数据目录 (在线程中执行阻塞的复制)。
+    默认只复制登录所需的文件 (copy_minimal_profile)，minimal=False 时完整复制整个目录。
+    """
+    if os.path.exists(destination):
+        print(f"已找到用户数据目录 '{destination}'，将直接使用。")
+        return
+    try:
+        print(f"未找到用户数据目录 '{destination}'。")
+        print(f"正在从默认配置{'复制登录所需的文件' if minimal else '完整复制，这可能需要几分钟时间'}...")
+        print(f"源: {source}")
+        print(f"目标: {destination}")
+
+        # <--- MODIFIED: 使用 to_thread 运行阻塞的 I/O 操作 ---
+        start_copy_time = time.time()
+        if minimal:
+            await asyncio.to_thread(copy_minimal_profile, source, destination)
+        else:
+            await asyncio.to_thread(
+                shutil.copytree,
+                source,
+                destination,
+                ignore=shutil.ignore_patterns('lockfile', '*.lock')
+            )
+        end_copy_time = time.time()
+        print(f"复制完成。耗时: {end_copy_time - start_copy_time:.2f} 秒")
+
+    except Exception as copy_error:
+        print(f"\n[严重错误] 复制用户数据失败: {copy_error}")
+        print(f"请确保浏览器已完全关闭 (包括任务管理器中的后台进程)，然后删除 '{destination}' 目录重试。")
+        raise copy_error
+
+
+def probe_cdp(debug_port: int, timeout: float = 1.0) -> bool:
+    """请求 http://localhost:端口/json/version，判断调试端口是否已就绪。"""
+    try:
+        with urllib.request.urlopen(f"http://localhost:{debug_port}/json/version", timeout=timeout) as response:
+            return 'webSocketDebuggerUrl' in json.loads(response.read())
+    except (OSError, ValueError):
+        return False
+
+
+async def wait_for_cdp(debug_port: int, timeout: float = 30.0, initial_delay: float = 0.1,
+                       max_delay: float = 1.0) -> bool:
+    """按指数退避轮询调试端口，直到就绪或超时 (取代固定等待 3 秒)。"""
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    while time.monotonic() < deadline:
+        if await asyncio.to_thread(probe_cdp, debug_port):
+            return True
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, max_delay)
+    return False
+
+
+# --- 浏览器会话管理函数 (collectHistoryUrls 与 delHistory 共用) ---
+@contextlib.asynccontextmanager
+async def get_async_browser_session(playwright: async_playwright, debug_port: int | None = None,
+                                    user_data_dir: str | None = None, storage_state: str | None = None,
+                                    full_profile_copy: bool = False, headless: bool = False) -> BrowserContext:
+    """
+    一个 ASYNC 上下文管理器，用于：
+    1. 优先尝试连接 Thorium(9222)，失败则尝试 Chrome(9223)。
+    2. 如果使用 Chrome，则异步复制默认 User Data 中登录所需的文件到 User Data2 (如果不存在) 并使用。
+    3. 如果调试端口未就绪，则异步启动对应的浏览器新实例，并轮询 /json/version 直到就绪。
+    4. 自动关闭由本脚本启动的浏览器进程。
+
+    debug_port / user_data_dir 用于同时运行多个浏览器实例 (shardRunner)：
+    指定后使用该调试端口，并从默认配置复制一份独立的用户数据目录 (不存在时)。
+
+    storage_state: Playwright 登录状态文件。文件已存在时直接以无头模式启动浏览器并载入该状态，
+    不复制用户数据、不占用调试端口；文件不存在时照常连接浏览器，并把当前登录状态保存到该文件供下次使用。
+
+    headless: 需要启动新实例时以无头模式 (--headless=new) 启动；连接已打开的浏览器时不受影响。
+    """
+    browser_process = None
+    context = None
+
+    exec_path, default_port, browser_name, default_user_data = select_browser()
+
+    # 0. 已有登录状态文件: 无头启动，秒级就绪
+    if storage_state and os.path.exists(storage_state):
+        print(f"使用登录状态文件 {storage_state}，以无头模式启动 {browser_name}...")
+        browser = await playwright.chromium.launch(executable_path=exec_path, headless=True)
+        try:
+            context = await browser.new_context(storage_state=storage_state)
+            yield context
+            await context.storage_state(path=storage_state)  # 保存刷新后的 Cookie
+        finally:
+            await browser.close()
+            print("\n任务结束，无头浏览器已关闭。")
+        return
+
+    # 1. 确定要使用的端口和用户数据目录
+    debug_port = debug_port or default_port
+    if user_data_dir is None and browser_name == "Chrome":
+        user_data_dir = default_user_data + '2'  # 即 'User Data2'
+    launch_user_data_dir = user_data_dir
+    if launch_user_data_dir:
+        await copy_user_data(default_user_data, launch_user_data_dir, minimal=not full_profile_copy)
+
+    print(f"将使用 {browser_name} (端口: {debug_port})")
+
+    try:
+        # 2. 调试端口已就绪则直接连接
+        print(f"正在检查 http://localhost:{debug_port}...")
+        if await asyncio.to_thread(probe_cdp, debug_port):
+            # <--- MODIFIED: 使用 async 版本的 connect_over_cdp ---
+            browser = await playwright.chromium.connect_over_cdp(f"http://localhost:{debug_port}")
+            context = browser.contexts[0]
+            print("连接成功！将使用已打开的浏览器实例。")
+
+        else:
+            # 3. 未就绪，则启动新实例
+            print(f"端口 {debug_port} 上没有可连接的浏览器。")
+            print(f"（提示：如果浏览器已打开，请确保它是用 --remote-debugging-port={debug_port} 启动的）")
+            print(f"正在启动一个新的 {browser_name} 实例...")
+
+            # <--- MODIFIED: 准备启动参数 ---
+            launch_args = [exec_path, f"--remote-debugging-port={debug_port}"]
+
+            if launch_user_data_dir:
+                launch_args.append(f"--user-data-dir={launch_user_data_dir}")
+                print(f"使用复制的用户数据目录: {launch_user_data_dir}")
+            if headless:
+                launch_args.append("--headless=new")
+
+            # <--- MODIFIED: 使用 asyncio.create_subprocess_exec 启动进程 ---
+            browser_process = await asyncio.create_subprocess_exec(*launch_args)
+
+            print("等待浏览器启动...")
+            start_wait_time = time.time()
+            if not await wait_for_cdp(debug_port):
+                raise TimeoutError(f"等待调试端口 {debug_port} 就绪超时")
+            print(f"调试端口已就绪 (耗时 {time.time() - start_wait_time:.2f} 秒)")
+
+            browser = await playwright.chromium.connect_over_cdp(f"http://localhost:{debug_port}")
+            context = browser.contexts[0]
+            print(f"新实例连接成功！")
+
+        if storage_state:
+            await context.storage_state(path=storage_state)
+            print(f"已保存登录状态到 {storage_state}，下次运行将直接以无头模式启动。")
+
+        # 4. 'yield' 上下文，供 with 语句块使用
+        yield context
+
+    except Exception as e:
+        print(f"\n[浏览器管理错误] 连接或启动 {browser_name} 时失败: {e}")
+        raise
+
+    finally:
+        # 5. 自动关闭 *由本脚本启动* 的浏览器进程
+        if browser_process:
+            print(f"\n任务结束，正在关闭由脚本启动的 {browser_name} 浏览器...")
+            browser_process.terminate()  # 终止浏览器进程
+            # <--- MODIFIED: 使用 await browser_process.wait() ---
+            await browser_process.wait()
+            print("浏览器已关闭。")
+        else:
+            print("\n任务结束。由于连接到的是现有浏览器实例，故不关闭浏览器。")
+
+
+def add_browser_arguments(parser: argparse.ArgumentParser):
+    """各入口脚本共用的浏览器会话参数 (对应 get_async_browser_session 的 storage_state / full_profile_copy / headless)。"""
+    parser.add_argument('--storage-state', help='Playwright 登录状态文件: 不存在时连接浏览器后保存，存在时直接以无头模式启动')
+    parser.add_argument('--full-profile-copy', action='store_true', help='首次运行时完整复制浏览器用户数据 (默认只复制登录所需的文件)')
+    parser.add_argument('--lean', action='store_true',
+                        help='精简模式: 新启动的浏览器以无头模式运行，并拦截图片、字体、样式表、遥测等无用请求')
+
+
+# --- 精简模式: 拦截读取表格行和执行 deleteOnClick() 都不需要的资源 ---
+BLOCKED_RESOURCE_TYPES = frozenset({'image', 'font', 'media', 'stylesheet'})
+# 遥测 / 统计请求 (按 URL 中的关键字匹配，不区分大小写)
+BLOCKED_URL_KEYWORDS = (
+    'browser.events.data.microsoft.com', 'vortex.data.microsoft.com', 'js.monitor.azure.com',
+    'applicationinsights', 'onecollector', 'aria.microsoft.com', 'clienttelemetry', 'google-analytics.com',
+    'googletagmanager.com', '/_layouts/15/telemetry', 'wsa.js',
+)
+# 只放行 SharePoint 自身与其 CDN 上的脚本 (deleteOnClick 及其依赖的 init.js / sp.js 等都在这些域名下)
+ALLOWED_SCRIPT_HOSTS = ('.sharepoint.com', '.sharepointonline.com', '.cdn.office.net', '.akamaihd.net')
+
+
+def should_block(resource_type: str, url: str) -> bool:
+    """精简模式下是否拦截该请求。页面文档、XHR 与删除回发始终放行。"""
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    lowered = url.lower()
+    if any(keyword in lowered for keyword in BLOCKED_URL_KEYWORDS):
+        return True
+    if resource_type == 'script':
+        host = urlsplit(lowered).hostname or ''
+        return not host.endswith(ALLOWED_SCRIPT_HOSTS)
+    return False
+
+
+class ResourceStats:
+    """
+    统计浏览器上下文的请求数、被拦截的请求数和传输字节数 (响应头 + 响应体)。
+
+    block=True 时同时安装 context.route 规则，按 should_block 拦截图片、字体、媒体、样式表、
+    遥测请求以及第三方脚本；block=False 时只统计，便于对比精简模式前后的流量。
+
+    用法：
+        stats = await ResourceStats.attach(browser_context, block=True)
+        ...
+        await stats.detach()
+        print(stats.summary_text(page_pool))
+    """
+
+    def __init__(self, browser_context: BrowserContext, block: bool):
+        self.browser_context = browser_context
+        self.block = block
+        self.requests = 0
+        self.blocked = 0
+        self.bytes = 0
+
+    @classmethod
+    async def attach(cls, browser_context: BrowserContext, block: bool = True) -> 'ResourceStats':
+        stats = cls(browser_context, block)
+        browser_context.on('request', stats._on_request)
+        browser_context.on('requestfinished', stats._on_finished)
+        if block:
+            await browser_context.route('**/*', stats._handle_route)
+        return stats
+
+    async def detach(self):
+        self.browser_context.remove_listener('request', self._on_request)
+        self.browser_context.remove_listener('requestfinished', self._on_finished)
+        if self.block:
+            await self.browser_context.unroute('**/*', self._handle_route)
+
+    def _on_request(self, request: Request):
+        self.requests += 1
+
+    async def _on_finished(self, request: Request):
+        try:
+            sizes = await request.sizes()
+            self.bytes += sizes['responseHeadersSize'] + sizes['responseBodySize']
+        except Exception:
+            pass  # 页面已关闭时无法获取大小，忽略
+
+    async def _handle_route(self, route: Route):
+        request = route.request
+        if should_block(request.resource_type, request.url):
+            self.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    def summary_text(self, page_pool: 'PagePool | None' = None) -> str:
+        text = (f"{'精简模式' if self.block else '资源统计'}: 请求 {self.requests} 个 (拦截 {self.blocked} 个)，"
+                f"传输 {self.bytes / 1024 / 1024:.1f} MB")
+        if page_pool is not None and page_pool.borrowed:
+            text += (f"，平均每页 {self.bytes / page_pool.borrowed / 1024:.1f} KB / "
+                     f"{page_pool.busy_seconds / page_pool.borrowed:.2f} 秒")
+        return text
+
+
+# --- 标签页池: 复用已打开的标签页，供 collectHistoryUrls 与 delHistory 共用 ---
+class PagePool:
+    """
+    维护最多 size 个“热”标签页，按需借出给 worker，并在原地 goto 复用。
+
+    - 借出数量即并发标签页上限 (取代原来每个脚本各自的 Semaphore)。
+    - 每个标签页使用 max_uses 次后关闭并重建，出错的标签页立即丢弃，避免 Chromium 内存持续增长。
+    - 自动接受弹窗的处理函数只在标签页创建时注册一次。
+
+    用法：
+        pool = PagePool(browser_context, size=15)
+        async with pool.page() as page:
+            await page.goto(url)
+        await pool.close()
+    """
+
+    def __init__(self, browser_context: BrowserContext, size: int = 15, max_uses: int = 50):
+        self.browser_context = browser_context
+        self.size = size
+        self.max_uses = max_uses
+        self._slots = asyncio.Semaphore(size)
+        self._idle: list[Page] = []
+        self._uses: dict[Page, int] = {}
+        self.created = 0
+        self.borrowed = 0
+        self.busy_seconds = 0.0  # 标签页被借出的累计时长，用于统计每个页面的平均耗时
+
+    async def _new_page(self) -> Page:
+        page = await self.browser_context.new_page()
+
+        # --- 关键: 设置事件监听器以自动接受弹窗 ---
+        async def handle_dialog(dialog: Dialog):
+            # --- MODIFIED: 添加 try/except 来处理 "No dialog is showing" 错误 ---
+            try:
+                await dialog.accept()
+            except Exception as e:
+                # 忽略 "No dialog is showing" 错误，这可能在竞态条件下发生
+                print(f'\n[警告] 尝试 accept() 一个已消失的弹窗 (已忽略): {e}')
+
+        page.on('dialog', handle_dialog)
+        self._uses[page] = 0
+        self.created += 1
+        METRICS.adjust('tabs_open', 1)
+        return page
+
+    async def _discard(self, page: Page):
+        self._uses.pop(page, None)
+        METRICS.adjust('tabs_open', -1)
+        if not page.is_closed():
+            try:
+                with METRICS.phase('close'):
+                    await page.close()
+            except Exception:
+                pass
+
+    @contextlib.asynccontextmanager
+    async def page(self):
+        """借出一个标签页；代码块正常结束则归还 (未超过 max_uses)，抛出异常则丢弃。"""
+        with METRICS.phase('tab_wait'):
+            await self._slots.acquire()
+        try:
+            page = None
+            while self._idle and page is None:
+                candidate = self._idle.pop()
+                if candidate.is_closed():
+                    self._uses.pop(candidate, None)
+                    METRICS.adjust('tabs_open', -1)
+                else:
+                    page = candidate
+            if page is None:
+                with METRICS.phase('new_page'):
+                    page = await self._new_page()
+
+            healthy = False
+            borrowed_at = time.monotonic()
+            METRICS.adjust('tabs_in_use', 1)
+            try:
+                yield page
+                healthy = True
+            finally:
+                METRICS.adjust('tabs_in_use', -1)
+                self.borrowed += 1
+                self.busy_seconds += time.monotonic() - borrowed_at
+                self._uses[page] = self._uses.get(page, 0) + 1
+                if healthy and not page.is_closed() and self._uses[page] < self.max_uses:
+                    self._idle.append(page)
+                else:
+                    await self._discard(page)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """关闭所有空闲的标签页。"""
+        idle, self._idle = self._idle, []
+        for page in idle:
+            await self._discard(page)
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+from datetime import datetime
+from playwright.async_api import async_playwright
+
+from adaptiveLimiter import AdaptiveLimiter
+from browserSession import add_browser_arguments, get_async_browser_session, PagePool, ResourceStats
+from collectHistoryUrls import get_feature_links
+from crawlState import CrawlState
+from folderSnapshot import FolderSnapshot, print_begin_run
+from deleteLedger import DeleteLedger
+from metrics import add_metrics_arguments, metrics_reporting
+from delHistory import (feed_links, run_delete_workers, open_link_and_trigger_delete, post_delete_over_http,
+                        print_latency_summary)
+from pickk import should_keep
+from retryPolicy import add_retry_arguments, build_retry_policy
+
+try:
+    from sharepointHttp import create_http_session
+except ImportError:  # aiohttp 未安装时仅浏览器模式可用
+    create_http_session = None
+
+
+# --- 从爬虫通道中取出链接，并按 pickk 的规则过滤 ---
+async def filtered_links(channel: asyncio.Queue):
+    """逐条读取爬虫放入通道的链接，遇到结束标记 None 时结束；被 pickk 规则过滤的链接直接跳过。"""
+    while True:
+        link = await channel.get()
+        if link is None:
+            return
+        if should_keep(link):
+            yield link
+
+
+# --- 主函数: 同一个浏览器会话内边爬边删 ---
+async def main(url, output_filename='links.txt', state_path='crawl_state.db', concurrency_limit=15,
+               initial_concurrency=4, backend='playwright', use_http=False,
+               ledger_path='delete_ledger.db', storage_state=None, full_profile_copy=False,
+               lean=False, metrics_interval=10.0, metrics_file=None, metrics_port=None, retry_policy=None,
+               snapshot_path=None):
+    """
+    把 collectHistoryUrls 与 delHistory 合并为一条流水线：
+    爬虫发现的链接经有界通道 (满时爬虫等待) 过滤后直接交给删除 worker，
+    两者共用一个浏览器会话、标签页池和自适应并发控制器，总耗时接近 max(爬取, 删除)。
+    删除结果记入删除台账，之后可用 delHistory --rerun 只重试失败的链接。
+    提供 snapshot_path 时进行增量扫描 (见 folderSnapshot)，只删除新增或有变化的文件的历史版本；
+    删除结束后只把台账中确认删除成功的文件及其所在子树并入快照。
+    """
+    total_found = 0
+    total_links = 0
+    total_processed = 0
+    latencies = []
+
+    if (use_http or backend == 'http') and create_http_session is None:
+        print("HTTP 模式需要 aiohttp，请先执行: pip install aiohttp")
+        return
+
+    state = CrawlState.fresh(state_path)
+    ledger = DeleteLedger(ledger_path)
+    snapshot = None
+    if snapshot_path:
+        snapshot = FolderSnapshot(snapshot_path)
+        print_begin_run(*snapshot.begin_run(ledger, needs_delete=should_keep))
+    try:
+        async with async_playwright() as p, metrics_reporting(metrics_interval, metrics_file, metrics_port):
+            print("正在启动 Playwright 并获取浏览器会话...")
+            async with get_async_browser_session(p, storage_state=storage_state,
+                                                 full_profile_copy=full_profile_copy,
+                                                 headless=lean) as browser_context:
+                print("浏览器会话已获取，开始边爬边删...")
+
+                # 爬取与删除访问的是同一个站点，共用一个控制器，任一方被限流都会整体降速
+                limiter = AdaptiveLimiter(initial_concurrency, 1, concurrency_limit)
+                page_pool = PagePool(browser_context, concurrency_limit)
+                resource_stats = await ResourceStats.attach(browser_context) if lean else None
+                http_session = None
+                if use_http or backend == 'http':
+                    http_session = await create_http_session(browser_context, concurrency_limit)
+                counter_lock = asyncio.Lock()
+
+                async def process_link(link, index):
+                    if backend == 'http':
+                        return await post_delete_over_http(link, http_session, index, counter_lock, limiter,
+                                                           latencies, ledger, retry_policy)
+                    return await open_link_and_trigger_delete(link, page_pool, index, counter_lock, limiter,
+                                                              latencies, ledger, retry_policy)
+
+                channel = asyncio.Queue(maxsize=concurrency_limit * 4)
+                delete_queue = asyncio.Queue(maxsize=concurrency_limit * 2)
+                try:
+                    with open(output_filename, 'w', encoding='utf-8') as file:
+                        print(f"将实时写入链接到 {output_filename}...")
+
+                        async def crawl():
+                            try:
+                                return await get_feature_links(url, page_pool, file, asyncio.Lock(),
+                                                               concurrency_limit, state,
+                                                               http_session if use_http else None, limiter, channel,
+                                                               policy=retry_policy, snapshot=snapshot)
+                            finally:
+                                await channel.put(None)  # 通知删除端爬取已结束
+
+                        crawler = asyncio.create_task(crawl())
+                        feeder = asyncio.create_task(feed_links(filtered_links(channel), delete_queue,
+                                                                concurrency_limit))
+                        total_processed = await run_delete_workers(delete_queue, concurrency_limit, process_link)
+                        total_found = await crawler
+                        total_links = await feeder
+                finally:
+                    await page_pool.close()
+                    if http_session is not None:
+                        await http_session.close()
+                    if resource_stats is not None:
+                        await resource_stats.detach()
+                        print(f"\n{resource_stats.summary_text(page_pool)}")
+
+            print(f"\n最终 {limiter.status_text()}")
+            if snapshot is not None:
+                print(snapshot.summary_text())
+                if state.load_failed():
+                    snapshot.reset_pending()
+                else:
+                    snapshot.mark_complete()
+                    # 只并入删除已在台账中确认 (或被 pickk 规则过滤、无需删除) 的文件及其所在子树
+                    promoted, held = snapshot.promote(ledger, should_keep)
+                    print(f"增量快照: 并入 {promoted} 行，{held} 个文件删除未成功，下次重新处理。")
+
+    except Exception as e:
+        print(f"\n发生致命错误: {e}")
+    finally:
+        state.close()
+        ledger.close()
+        if snapshot is not None:
+            snapshot.close()
+
+    print(f'\n{datetime.now().strftime("%Y-%m-%d %H:%M:%S")} 边爬边删完成！')
+    print(f"共找到 {total_found} 个链接，过滤后 {total_links} 个，成功处理 {total_processed} 个。")
+    print_latency_summary(latencies)
+
+
+# --- 启动器 ---
+if __name__ == "__main__":
+    start_url = 'https://brecenmoqi.sharepoint.com/sites/jiemo/_layouts/15/storman.aspx?root=Shared%20Documents'
+
+    parser = argparse.ArgumentParser(description='单进程边爬边删: 收集“版本历史记录”链接并立即清除')
+    parser.add_argument('--start-url', default=start_url, help='起始 storman.aspx 地址')
+    parser.add_argument('--output', default='links.txt', help='同时写出的链接文件 (留作记录)')
+    parser.add_argument('--state', default='crawl_state.db', help='爬取状态文件 (SQLite)')
+    parser.add_argument('--concurrency', type=int, default=15, help='最大并发数量')
+    parser.add_argument('--initial-concurrency', type=int, default=4, help='初始并发数量 (随后自适应调整)')
+    parser.add_argument('--backend', choices=['playwright', 'http'], default='playwright', help='删除后端')
+    parser.add_argument('--http', action='store_true', help='爬取时使用 HTTP 快速模式 (需要 aiohttp)')
+    parser.add_argument('--ledger', default='delete_ledger.db', help='删除台账文件 (SQLite)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量扫描: 与上次完整爬取的快照比较，跳过未变化的子文件夹，只处理新增或有变化的文件')
+    parser.add_argument('--snapshot', default='folder_snapshot.db', help='增量扫描的快照文件 (SQLite)')
+    add_browser_arguments(parser)
+    add_retry_arguments(parser, delete=True)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    print(f"起始 URL: {args.start_url}")
+    asyncio.run(main(args.start_url, args.output, args.state, args.concurrency, args.initial_concurrency,
+                     args.backend, args.http, args.ledger, args.storage_state,
+                     args.full_profile_copy, args.lean,
+                     args.metrics_interval, args.metrics_file, args.metrics_port, build_retry_policy(args),
+                     args.snapshot if args.incremental else None))
@@ -1,267 +1,388 @@
+import argparse
 import asyncio
+import json
 import os
-import contextlib
-import shutil
-import time  # 保留 time 只是为了打印日志，睡眠已改为 asyncio.sleep
 from playwright.async_api import async_playwright
-from playwright.async_api import BrowserContext  # 明确导入类型
 
-# --- 浏览器路径配置 (来自 thoriumDebugDemo.py) ---
-THORIUM_PATH = r"C:\Users\Administrator\AppData\Local\Thorium\Application\thorium.exe"
-CHROME_PATH = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
-
-
-# --- 浏览器会话管理函数 (已重构为 ASYNC) ---
-@contextlib.asynccontextmanager
-async def get_async_browser_session(playwright: async_playwright) -> BrowserContext:
-    """
-    一个 ASYNC 上下文管理器，用于：
-    1. 优先尝试连接 Thorium(9222)，失败则尝试 Chrome(9223)。
-    2. 如果使用 Chrome，则异步复制默认 User Data 到 User Data2 (如果不存在) 并使用。
-    3. 如果连接失败，则异步启动对应的浏览器新实例。
-    4. 自动关闭由本脚本启动的浏览器进程。
+from adaptiveLimiter import AdaptiveLimiter, ThrottledError, check_throttled
+from browserSession import add_browser_arguments, get_async_browser_session, PagePool, ResourceStats
+from crawlState import DONE_MARKER_SUFFIX, CrawlState
+from folderSnapshot import FolderSnapshot, promote_previous_run
+from linkStore import LineBuffer
+from metrics import METRICS, add_metrics_arguments, metrics_reporting
+from pickk import LinkFilter, DEFAULT_EXCLUDED_EXTENSIONS, split_values
+from retryPolicy import RetryPolicy, add_retry_arguments, build_retry_policy
+from stormanRows import CrawlPruner, make_row, parse_size, to_record
+
+try:
+    from sharepointHttp import create_http_session, fetch_storman_page
+except ImportError:  # aiohttp 未安装时仅浏览器模式可用
+    create_http_session = fetch_storman_page = None
+
+
+# --- 单页抓取函数: 打开一个 storman.aspx 页面并提取三类链接 ---
+async def scrape_storman_page(url: str, page_pool: PagePool,
+                              policy: RetryPolicy | None = None) -> tuple[list[dict], list[dict], str | None]:
     """
-    browser_process = None
-    context = None
-    launch_user_data_dir = None
-
-    # 1. 确定要使用的浏览器和端口
-    if os.path.exists(THORIUM_PATH):
-        exec_path = THORIUM_PATH
-        debug_port = 9222
-        browser_name = "Thorium"
-    elif os.path.exists(CHROME_PATH):
-        exec_path = CHROME_PATH
-        debug_port = 9223
-        browser_name = "Chrome"
-
-        # --- MODIFIED: Chrome User Data 复制逻辑 (使用 asyncio.to_thread) ---
-        try:
-            default_user_data_src = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Google', 'Chrome',
-                                                 'User Data')
-            copied_user_data_dest = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Google', 'Chrome',
-                                                 'User Data2')
-
-            if not os.path.exists(copied_user_data_dest):
-                print(f"未找到 'User Data2' 目录。")
-                print(f"正在从默认配置复制，这可能需要几分钟时间...")
-                print(f"源: {default_user_data_src}")
-                print(f"目标: {copied_user_data_dest}")
-
-                # <--- MODIFIED: 使用 to_thread 运行阻塞的 I/O 操作 ---
-                start_copy_time = time.time()
-                await asyncio.to_thread(
-                    shutil.copytree,
-                    default_user_data_src,
-                    copied_user_data_dest,
-                    ignore=shutil.ignore_patterns('lockfile', '*.lock')
-                )
-                end_copy_time = time.time()
-                print(f"复制完成。耗时: {end_copy_time - start_copy_time:.2f} 秒")
-            else:
-                print(f"已找到 'User Data2' 目录，将直接使用。")
-
-            launch_user_data_dir = copied_user_data_dest
-
-        except Exception as copy_error:
-            print(f"\n[严重错误] 复制 Chrome User Data 失败: {copy_error}")
-            print("请确保 Chrome 浏览器已完全关闭 (包括任务管理器中的后台进程)，然后删除 'User Data2' 目录重试。")
-            raise copy_error
-        # --- 复制逻辑结束 ---
-
-    else:
-        print(f"错误: Thorium 和 Chrome 路径均未找到。")
-        print(f"Thorium 路径: {THORIUM_PATH}")
-        print(f"Chrome 路径: {CHROME_PATH}")
-        raise FileNotFoundError("未找到 Thorium 或 Chrome 浏览器。")
-
-    print(f"将使用 {browser_name} (端口: {debug_port})")
-
-    try:
-        # 2. 优先尝试连接
-        try:
-            print(f"正在尝试连接到 http://localhost:{debug_port}...")
-            # <--- MODIFIED: 使用 async 版本的 connect_over_cdp ---
-            browser = await playwright.chromium.connect_over_cdp(f"http://localhost:{debug_port}")
-            context = browser.contexts[0]
-            print("连接成功！将使用已打开的浏览器实例。")
-
-        except Exception as e:
-            # 3. 连接失败，则启动新实例
-            print(f"连接失败 ({e})。")
-            print(f"（提示：如果浏览器已打开，请确保它是用 --remote-debugging-port={debug_port} 启动的）")
-            print(f"正在启动一个新的 {browser_name} 实例...")
-
-            # <--- MODIFIED: 准备启动参数 ---
-            launch_args = [exec_path, f"--remote-debugging-port={debug_port}"]
-
-            if browser_name == "Chrome" and launch_user_data_dir:
-                launch_args.append(f"--user-data-dir={launch_user_data_dir}")
-                print(f"使用复制的用户数据目录: {launch_user_data_dir}")
-
-            # <--- MODIFIED: 使用 asyncio.create_subprocess_exec 启动进程 ---
-            browser_process = await asyncio.create_subprocess_exec(*launch_args)
-
-            print("等待浏览器启动...")
-            # <--- MODIFIED: 使用 asyncio.sleep ---
-            await asyncio.sleep(3)  # 等待进程启动
-
-            # 再次尝试连接
-            browser = await playwright.chromium.connect_over_cdp(f"http://localhost:{debug_port}")
-            context = browser.contexts[0]
-            print(f"新实例连接成功！")
-
-        # 4. 'yield' 上下文，供 with 语句块使用
-        yield context
-
-    except Exception as e:
-        print(f"\n[浏览器管理错误] 连接或启动 {browser_name} 时失败: {e}")
-        raise
-
-    finally:
-        # 5. 自动关闭 *由本脚本启动* 的浏览器进程
-        if browser_process:
-            print(f"\n任务结束，正在关闭由脚本启动的 {browser_name} 浏览器...")
-            browser_process.terminate()  # 终止浏览器进程
-            # <--- MODIFIED: 使用 await browser_process.wait() ---
-            await browser_process.wait()
-            print("浏览器已关闭。")
-        else:
-            print("\n任务结束。由于连接到的是现有浏览器实例，故不关闭浏览器。")
-
-
-# --- 爬虫函数 (修改为接受 file_handle, lock 和 semaphore, 并立即写入) ---
-async def get_feature_links(url: str, browser: BrowserContext, file_handle, lock: asyncio.Lock,
-                            semaphore: asyncio.Semaphore) -> int:
-    """
-    递归爬取 SharePoint 页面以获取所有“版本历史记录”链接, 并立即写入文件。
-
-    Args:
-        url: 要爬取的起始 URL。
-        browser: Playwright 的 BrowserContext 实例 (由 get_async_browser_session 提供)。
-        file_handle: 已打开的可写文件句柄。
-        lock: 用于同步文件写入的 asyncio.Lock。
-        semaphore: 用于控制并发标签页数量的 asyncio.Semaphore。
+    借用标签页池中的一个标签页打开 storman.aspx 页面，提取子文件夹行、“版本历史记录”行以及“下一个”分页链接。
+    每行记录由 stormanRows.make_row 生成 (url、name、各列文本、大小)，供剪枝规则使用。
+    打开页面与等待表格分别使用 policy 中的超时。
 
     Returns:
-        一个整数，表示在此分支中找到的链接数量。
+        (folder_rows, feature_rows, next_page_link)
     """
-    links_found_count = 0
-    page = None  # 在 try 外部定义 page 以便在 finally 中使用
-    try:
-        # --- MODIFIED: 在创建页面前获取信号量 ---
-        print(f"[{url}] 等待信号量...")
-        async with semaphore:
-            print(f"[{url}] 已获取信号量，正在打开页面...")
-            page = await browser.new_page()
-            print(f"正在处理: {url}")
-            await page.goto(url, timeout=120000)
-            await page.wait_for_selector('tr', timeout=120000)
-
-            folder_links = await page.evaluate('''() => {
-                const links = [];
-                const rows = document.querySelectorAll('tr');
-                rows.forEach(row => {
+    policy = policy or RetryPolicy()
+    async with page_pool.page() as page:
+        with METRICS.phase('goto'):
+            response = await page.goto(url, timeout=policy.goto_timeout * 1000)
+            if response is not None:
+                check_throttled(response.status, response.headers)
+        with METRICS.phase('wait_for_selector'):
+            await page.wait_for_selector('tr', timeout=policy.selector_timeout * 1000)
+
+        with METRICS.phase('evaluate'):
+            folders, features, next_page_link = await page.evaluate('''() => {
+                const cellsOf = row => row ? Array.from(row.querySelectorAll('td')).map(td => td.innerText) : [];
+
+                const folders = [];
+                document.querySelectorAll('tr').forEach(row => {
                     const folderLink = row.querySelector('td:nth-child(2) a');
                     if (folderLink && folderLink.href.includes('/storman.aspx?root=')) { // 确保是文件夹链接
-                        links.push(folderLink.href);
+                        folders.push([folderLink.href, cellsOf(row)]);
                     }
                 });
-                return links;
-            }''')
 
-            feature_links_on_page = await page.evaluate('''() => {
-                const links = [];
-                const featureLinks = document.querySelectorAll('a');
-                featureLinks.forEach(link => {
+                const features = [];
+                document.querySelectorAll('a').forEach(link => {
                     if (link.textContent === '版本历史记录') {
-                        links.push(link.href);
+                        features.push([link.href, cellsOf(link.closest('tr'))]);
                     }
                 });
-                return links;
-            }''')
-
-            # --- MODIFIED: 立即写入文件 ---
-            if feature_links_on_page:
-                async with lock:  # 文件锁
-                    for link in feature_links_on_page:
-                        file_handle.write(link + '\n')
-                links_found_count += len(feature_links_on_page)
-                print(f"在 {url} 找到 {len(feature_links_on_page)} 个链接并已写入。")
-            # --- 写入结束 ---
 
-            next_page_link = await page.evaluate('''() => {
                 const nextPageLink = Array.from(document.querySelectorAll('a')).find(el => el.innerText.includes('下一个'));
-                return nextPageLink ? nextPageLink.href : null;
+                return [folders, features, nextPageLink ? nextPageLink.href : null];
             }''')
 
-            await page.close()
-            print(f"[{url}] 页面已关闭，释放信号量。")
-        # --- 信号量在此自动释放 ---
+        return ([make_row(href, cells) for href, cells in folders],
+                [make_row(href, cells) for href, cells in features],
+                next_page_link)
 
-        # 递归调用在信号量块之外发起
-        # 递归处理下一页
-        if next_page_link:
-            print(f"找到下一页: {next_page_link}")
-            # --- MODIFIED: 传递 file_handle, lock 和 semaphore ---
-            links_found_count += await get_feature_links(next_page_link, browser, file_handle, lock, semaphore)
 
-        # 递归处理子文件夹
-        # 使用 asyncio.gather 并发处理所有子文件夹
-        # --- MODIFIED: 传递 file_handle, lock 和 semaphore ---
-        folder_tasks = [get_feature_links(link, browser, file_handle, lock, semaphore) for link in folder_links]
-        results = await asyncio.gather(*folder_tasks)
+# --- 爬虫函数 (广度优先工作队列, 固定数量的 worker) ---
+async def get_feature_links(url: str, page_pool: PagePool, file_handle, lock: asyncio.Lock,
+                            worker_count: int = 15, state: CrawlState | None = None, http_session=None,
+                            limiter: AdaptiveLimiter | None = None, link_sink: asyncio.Queue | None = None,
+                            pruner: CrawlPruner | None = None, output_format: str = 'txt',
+                            policy: RetryPolicy | None = None, snapshot: FolderSnapshot | None = None) -> int:
+    """
+    广度优先爬取 SharePoint 页面以获取所有“版本历史记录”链接, 并立即写入文件。
 
-        # results 现在是链接数量的列表 [int, int, ...]
-        links_found_count += sum(results)
+    待访问的页面 (子文件夹与“下一个”分页) 放入 asyncio.Queue，由固定数量的 worker 协程消费，
+    visited 集合保证每个页面只打开一次。内存占用只与待访问队列的大小有关，与目录树深度无关。
 
-        print(f"在 {url} 及其子项中完成处理。")
-        return links_found_count
+    Args:
+        url: 要爬取的起始 URL。
+        page_pool: 标签页池 (基于 get_async_browser_session 提供的 BrowserContext)。
+        file_handle: 已打开的可写文件句柄。
+        lock: 用于同步文件写入的 asyncio.Lock。
+        worker_count: worker 协程数量，即同时处理页面数量的上限。
+        state: 可选的 CrawlState。提供时每个页面完成后都会记录断点，
+               且若其中已有进度，则从记录的 frontier 继续而不是从 url 重新开始。
+        http_session: 可选的 aiohttp 会话 (由 sharepointHttp.create_http_session 创建)。
+                      提供时直接通过 HTTP 获取并解析页面，不再为每个页面打开标签页。
+        limiter: 可选的 AdaptiveLimiter，在 worker_count 之内动态调整实际并发。
+                 未提供时使用固定为 worker_count 的并发。被限流的页面会重新入队。
+        link_sink: 可选的有界队列。提供时每个写入文件的链接也会放入该队列 (队列满时等待)，
+                   供 collectAndDelete 的删除 worker 边爬边删。
+        pruner: 可选的 CrawlPruner。子文件夹在入队前、文件链接在写出前按其规则剪枝。
+        output_format: 'txt' 每行一个链接；'jsonl' 每行一条 JSON 记录 (url、path、size、version_size)，
+                       供 delHistory --by-size 按可释放空间排序。
+        policy: 可选的 RetryPolicy (各阶段超时与重试次数)。出错的页面随机退避后原样重新入队，
+                尝试次数用尽后记为失败 (提供 state 时写入其 failed 表)，其子树可在 --resume 时重新爬取。
+        snapshot: 可选的 FolderSnapshot (增量扫描)。与上次完整爬取相比未变化的子文件夹不再访问，
+                  未变化的文件不再输出。
 
-    except Exception as e:
-        print(f"处理 {url} 时出错: {e}")
-        if page and not page.is_closed():
-            await page.close()  # 确保页面关闭
-        # async with 会自动处理异常并释放信号量
-        return 0  # 返回0以继续执行
+    Returns:
+        一个整数，表示本次运行新写入的链接数量。
+    """
+    if limiter is None:
+        limiter = AdaptiveLimiter(worker_count, worker_count, worker_count)
+    policy = policy or RetryPolicy()
+    queue: asyncio.Queue[str] = asyncio.Queue()
+    if state is not None:
+        visited = state.load_visited()
+        seeds = state.load_frontier()
+        if not seeds and not visited:
+            seeds = [url]
+            state.add_frontier(seeds)
+        elif visited:
+            print(f"从断点继续: 已完成 {len(visited)} 个页面，待处理 {len(seeds)} 个页面。")
+    else:
+        visited = set()
+        seeds = [url]
+    visited.update(seeds)
+    for seed in seeds:
+        queue.put_nowait(seed)
+    links_found_count = 0
+    emitted: set[str] = set()  # 未提供 state 时在内存中去重
+    output = LineBuffer(file_handle)
+    attempts: dict[str, int] = {}  # 页面 -> 已失败次数
+    throttled: dict[str, int] = {}  # 页面 -> 被限流次数 (单独计数)
+    failed: list[str] = []  # 重试次数用尽的页面
+    retries: set[asyncio.Task] = set()
+
+    async def requeue_later(page_url: str, delay: float):
+        # 等待期间该页面仍计入队列的未完成任务，queue.join() 不会提前结束
+        await asyncio.sleep(delay)
+        queue.put_nowait(page_url)
+        queue.task_done()
+
+    def give_up(page_url: str, count: int, error: Exception):
+        # 尝试次数用尽: 记为失败 (提供 state 时写入断点文件)，其子树在结束时列出，可 --resume 重试
+        METRICS.inc('pages_failed')
+        failed.append(page_url)
+        print(f"处理 {page_url} 失败 {count} 次，已放弃: {error}")
+        if state is not None:
+            state.record_failure(page_url, count, str(error))
+
+    async def worker(worker_id: int):
+        nonlocal links_found_count
+        while True:
+            page_url = await queue.get()
+            requeued = False
+            try:
+                async with limiter.slot():
+                    print(f"[worker-{worker_id}] 正在处理: {page_url} (队列剩余 {queue.qsize()}, {limiter.status_text()})")
+                    if http_session is not None:
+                        with METRICS.phase('http_fetch'):
+                            result = await fetch_storman_page(http_session, page_url, policy.http_timeout)
+                    else:
+                        result = await scrape_storman_page(page_url, page_pool, policy)
+                folder_rows, feature_rows, next_page_link = result
+                METRICS.inc('pages_crawled')
+
+                # 剪枝: 不访问被排除的文件夹，不输出不需要清理的文件
+                if pruner is not None:
+                    folder_rows = [row for row in folder_rows if pruner.keep_folder(row)]
+                    feature_rows = [row for row in feature_rows if pruner.keep_file(row, page_url)]
+                # 增量扫描: 不访问未变化的子文件夹 (子树)，不输出未变化的文件
+                if snapshot is not None:
+                    folder_rows, feature_rows = snapshot.filter_page(page_url, folder_rows, feature_rows)
+                folder_links = [row['url'] for row in folder_rows]
+                # 链接记录 (含页面显示的大小)，同一页面内按链接去重
+                records = list({row['url']: to_record(row, page_url) for row in feature_rows}.values())
+
+                # 下一页与子文件夹都作为新的待访问页面
+                if next_page_link:
+                    print(f"找到下一页: {next_page_link}")
+                new_pages = []
+                for link in ([next_page_link] if next_page_link else []) + folder_links:
+                    if link not in visited:
+                        visited.add(link)
+                        new_pages.append(link)
+
+                # 先记录断点并去重 (分页重叠或重复到达的文件夹不会重复输出)，只写入此前从未输出过的链接
+                if state is not None:
+                    records = state.complete_page(page_url, new_pages, records)
+                else:
+                    records = [record for record in records if record['url'] not in emitted]
+                    emitted.update(record['url'] for record in records)
+
+                # 写入输出缓冲区，按批写入文件
+                if records:
+                    async with lock:  # 文件锁
+                        output.write(json.dumps(record, ensure_ascii=False) if output_format == 'jsonl'
+                                     else record['url'] for record in records)
+                    links_found_count += len(records)
+                    METRICS.inc('links_emitted', len(records))
+                    print(f"在 {page_url} 找到 {len(records)} 个链接并已写入。")
+                    if link_sink is not None:
+                        for record in records:
+                            await link_sink.put(record['url'])
+
+                for link in new_pages:
+                    queue.put_nowait(link)
+
+            except ThrottledError as e:
+                # 被限流: 控制器已降低并发并暂停，页面重新入队稍后再试 (次数单独计数，用尽后记为失败)
+                throttled[page_url] = throttled.get(page_url, 0) + 1
+                if throttled[page_url] < policy.max_throttle_attempts:
+                    print(f"处理 {page_url} 时{e}，已重新入队。({limiter.status_text()})")
+                    queue.put_nowait(page_url)
+                else:
+                    give_up(page_url, throttled[page_url], e)
+            except Exception as e:
+                attempts[page_url] = attempts.get(page_url, 0) + 1
+                if attempts[page_url] < policy.max_attempts:
+                    # 有界重试: 随机退避后把同一个页面重新入队，worker 不在等待期间空占
+                    delay = policy.retry_delay(attempts[page_url])
+                    METRICS.inc('pages_retried')
+                    print(f"处理 {page_url} 时出错 (第 {attempts[page_url]} 次): {e}，{delay:.1f} 秒后重试。")
+                    task = asyncio.create_task(requeue_later(page_url, delay))
+                    retries.add(task)
+                    task.add_done_callback(retries.discard)
+                    requeued = True
+                else:
+                    give_up(page_url, attempts[page_url], e)
+            finally:
+                if not requeued:
+                    queue.task_done()
+
+    workers = [asyncio.create_task(worker(i)) for i in range(worker_count)]
+    try:
+        await queue.join()  # 队列清空且所有页面处理完毕
+    finally:
+        for task in [*workers, *retries]:
+            task.cancel()
+        await asyncio.gather(*workers, *retries, return_exceptions=True)
+        async with lock:
+            output.flush()
+
+    print(f"共访问 {len(visited)} 个页面。")
+    if failed:
+        print(f"{len(failed)} 个页面多次重试后仍失败，其下的文件夹与分页未被爬取"
+              f"{' (已记录在断点文件中，可使用 --resume 重试)' if state is not None else ''}:")
+        for page_url in failed:
+            print(f"  {page_url}")
+    return links_found_count
+
+
+# --- 爬取时剪枝规则的命令行参数 (shardRunner 共用) ---
+def add_pruner_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--skip-folder', action='append', default=[],
+                        help='不访问路径匹配此通配符的文件夹 (及其子树)，如 "Shared Documents/备份*"，可多次指定')
+    parser.add_argument('--filter', action='store_true', help='爬取时即按 pickk 的默认扩展名规则过滤文件')
+    parser.add_argument('--exclude-ext', action='append', help='爬取时额外过滤的扩展名，逗号分隔')
+    parser.add_argument('--include-ext', action='append', help='爬取时只输出这些扩展名，逗号分隔')
+    parser.add_argument('--min-size', help='只输出页面显示大小不小于此值的文件，如 50MB')
+
+
+def build_pruner(args: argparse.Namespace, parser: argparse.ArgumentParser) -> CrawlPruner | None:
+    """根据命令行参数创建剪枝规则；不指定任何规则时返回 None (保持原有行为)。"""
+    excluded = (*(DEFAULT_EXCLUDED_EXTENSIONS if args.filter else ()), *split_values(args.exclude_ext))
+    included = split_values(args.include_ext)
+    min_size = parse_size(args.min_size) if args.min_size else 0
+    if args.min_size and min_size is None:
+        parser.error(f"无法解析 --min-size {args.min_size}，示例: 500KB、50MB、1GB")
+    if args.skip_folder or excluded or included or min_size:
+        link_filter = LinkFilter(excluded, included) if excluded or included else None
+        return CrawlPruner(args.skip_folder, link_filter, min_size)
+    return None
 
 
 # --- 主函数 (修改后使用新的 context manager) ---
-async def main(url):
+async def main(url, output_filename='links.txt', state_path='crawl_state.db', resume=False, concurrency_limit=15,
+               use_http=False, initial_concurrency=4, pruner=None, output_format='txt', storage_state=None,
+               full_profile_copy=False, lean=False, measure=False, metrics_interval=10.0, metrics_file=None, metrics_port=None,
+               retry_policy=None, snapshot_path=None, ledger_path='delete_ledger.db'):
     total_links_found = 0
+    done_marker = output_filename + DONE_MARKER_SUFFIX
+    if os.path.exists(done_marker):
+        os.remove(done_marker)
     try:
-        async with async_playwright() as p:
+        # --- NEW: 打开断点状态库。非续爬模式下清空旧状态 ---
+        if resume and os.path.exists(state_path):
+            state = CrawlState(state_path)
+            print(f"续爬模式: 使用断点文件 {state_path}")
+        else:
+            if resume:
+                print(f"未找到断点文件 {state_path}，将从头开始爬取。")
+            state = CrawlState.fresh(state_path)
+
+        if use_http and create_http_session is None:
+            print("HTTP 快速模式需要 aiohttp，请先执行: pip install aiohttp")
+            return
+
+        # --- NEW: 增量扫描，只重新访问有变化的文件夹 ---
+        snapshot = None
+        if snapshot_path:
+            snapshot = FolderSnapshot(snapshot_path)
+            promote_previous_run(snapshot, ledger_path, resume)
+            if snapshot.is_empty():
+                print(f"增量扫描: {snapshot_path} 中还没有快照，本次完整爬取并建立快照。")
+            else:
+                print(f"增量扫描: 与 {snapshot_path} 中的快照比较，只输出新增或有变化的文件。")
+
+        async with async_playwright() as p, metrics_reporting(metrics_interval, metrics_file, metrics_port):
             print("正在启动 Playwright 并获取浏览器会话...")
             # <--- MODIFIED: 使用新的 async context manager ---
             # 它会返回一个 BrowserContext，这与 launch_persistent_context 的返回类型一致
-            async with get_async_browser_session(p) as browser_context:
+            async with get_async_browser_session(p, storage_state=storage_state,
+                                                 full_profile_copy=full_profile_copy,
+                                                 headless=lean) as browser_context:
                 print("浏览器会话已获取，开始爬取...")
 
-                # --- MODIFIED: 在爬取前打开文件并创建锁和信号量 ---
+                # --- MODIFIED: 在爬取前打开文件并创建锁 ---
                 file_lock = asyncio.Lock()
 
-                # --- NEW: 创建并发信号量 ---
-                concurrency_limit = 15
-                semaphore = asyncio.Semaphore(concurrency_limit)
-                print(f"并发标签页上限设置为: {concurrency_limit}")
-
-                output_filename = 'links.txt'
+                # --- MODIFIED: worker 数量即并发上限，实际并发由 AIMD 控制器动态调整 ---
+                limiter = AdaptiveLimiter(initial_concurrency, 1, concurrency_limit)
+                print(f"并发上限 (worker 数量) 设置为: {concurrency_limit}，初始并发: {limiter.current_limit}")
 
                 with open(output_filename, 'w', encoding='utf-8') as file:
+                    # --- NEW: 续爬时以断点库为准重写已输出的链接，保证不重复也不丢失 ---
+                    for line in state.iter_emitted(output_format):
+                        file.write(line + '\n')
                     print(f"将实时写入链接到 {output_filename}...")
 
-                    # --- MODIFIED: 传递文件句柄、锁和信号量, 并接收总数 ---
-                    total_links_found = await get_feature_links(url, browser_context, file, file_lock, semaphore)
+                    # --- NEW: HTTP 快速模式，复用浏览器 Cookie，不再为每个页面打开标签页 ---
+                    http_session = None
+                    if use_http:
+                        http_session = await create_http_session(browser_context, concurrency_limit)
+                        print("已启用 HTTP 快速模式 (复用浏览器 Cookie)。")
+
+                    # --- NEW: 标签页池，复用标签页而不是每个页面新建/关闭 ---
+                    page_pool = PagePool(browser_context, concurrency_limit)
+
+                    # --- NEW: 精简模式拦截无用资源；--measure 只统计流量，便于与精简模式对比 ---
+                    resource_stats = None
+                    if lean or measure:
+                        resource_stats = await ResourceStats.attach(browser_context, block=lean)
+
+                    try:
+                        # --- MODIFIED: 传递文件句柄、锁、worker 数量和断点状态 ---
+                        await get_feature_links(url, page_pool, file, file_lock, concurrency_limit, state,
+                                                http_session, limiter, pruner=pruner, output_format=output_format,
+                                                policy=retry_policy, snapshot=snapshot)
+                    finally:
+                        await page_pool.close()
+                        if http_session is not None:
+                            await http_session.close()
+                        if resource_stats is not None:
+                            await resource_stats.detach()
+                            print(f"\n{resource_stats.summary_text(page_pool)}")
+                    total_links_found = state.count_emitted()
 
             # <--- MODIFIED: 移除了 await browser.close() ---
             # context manager 会自动处理进程关闭
             # <--- MODIFIED: 移除了文件写入逻辑 (已在内部完成) ---
 
             print(f"\n爬取完成。总共找到并写入 {total_links_found} 个链接。")
-            print('写入 links.txt 完成！ over over!!!')
+            print(f"最终 {limiter.status_text()}")
+            if pruner is not None:
+                print(f"剪枝: 跳过 {pruner.pruned_folders} 个文件夹，{pruner.pruned_files} 个文件。")
+            if failed_pages := state.load_failed():
+                print(f"注意: {len(failed_pages)} 个页面未能爬取 (记录在 {state_path})，可使用 --resume 重试这些子树。")
+            if snapshot is not None:
+                print(snapshot.summary_text())
+                if failed_pages:
+                    snapshot.reset_pending()
+                    print("存在未能爬取的页面，本次的指纹不会并入增量快照。")
+                else:
+                    snapshot.mark_complete()
+                    print(f"本次的指纹将在下一次增量运行开始时，按删除台账 {ledger_path} 确认删除后并入快照。")
+                snapshot.close()
+            print(f'写入 {output_filename} 完成！ over over!!!')
+
+        # --- NEW: 写出完成标记，通知以 --follow 模式运行的 delHistory ---
+        with open(done_marker, 'w', encoding='utf-8'):
+            pass
+
+        state.close()
 
     except Exception as e:
         print(f"发生致命错误: {e}")
+        print(f"可使用 --resume 从断点继续。")
 
 
 # --- 启动器 (来自您的原始脚本) ---
@@ -269,6 +390,35 @@ if __name__ == "__main__":
     # start_url = 'https://brecenmoqi-my.sharepoint.com/personal/jiemo_todesign_cn/_layouts/15/storman.aspx?root=Documents'
     start_url = 'https://brecenmoqi.sharepoint.com/sites/jiemo/_layouts/15/storman.aspx?root=Shared%20Documents'
 
-    print(f"起始 URL: {start_url}")
-    asyncio.run(main(start_url))
-
+    parser = argparse.ArgumentParser(description='收集 OneDrive / SharePoint 的“版本历史记录”链接')
+    parser.add_argument('--start-url', default=start_url, help='起始 storman.aspx 地址')
+    parser.add_argument('--output', default='links.txt', help='输出的链接文件')
+    parser.add_argument('--format', choices=['txt', 'jsonl'],
+                        help='输出格式: txt 每行一个链接; jsonl 每行一条含 url/path/size/version_size 的记录 '
+                             '(默认按 --output 的扩展名判断)')
+    parser.add_argument('--state', default='crawl_state.db', help='断点状态文件 (SQLite)')
+    parser.add_argument('--resume', action='store_true', help='从上次中断的位置继续爬取')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量扫描: 与上次完整爬取的快照比较，跳过未变化的子文件夹，只输出新增或有变化的文件')
+    parser.add_argument('--snapshot', default='folder_snapshot.db', help='增量扫描的快照文件 (SQLite)')
+    parser.add_argument('--ledger', default='delete_ledger.db',
+                        help='delHistory 的删除台账: 增量扫描只把台账中已确认删除的文件并入快照')
+    parser.add_argument('--concurrency', type=int, default=15, help='最大并发数量')
+    parser.add_argument('--initial-concurrency', type=int, default=4, help='初始并发数量 (随后自适应调整)')
+    parser.add_argument('--http', action='store_true', help='HTTP 快速模式: 复用浏览器 Cookie 直接请求页面 (需要 aiohttp)')
+    add_browser_arguments(parser)
+    parser.add_argument('--measure', action='store_true', help='只统计传输字节数与每页耗时 (不拦截)，用于对比 --lean')
+    add_pruner_arguments(parser)
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    pruner = build_pruner(args, parser)
+
+    output_format = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'txt')
+
+    print(f"起始 URL: {args.start_url}")
+    asyncio.run(main(args.start_url, args.output, args.state, args.resume, args.concurrency, args.http,
+                     args.initial_concurrency, pruner, output_format, args.storage_state, args.full_profile_copy,
+                     args.lean, args.measure, args.metrics_interval, args.metrics_file, args.metrics_port,
+                     build_retry_policy(args), args.snapshot if args.incremental else None,
+                     args.ledger))
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import time
+
+from linkStore import LinkStore
+
+# 爬取完成后在链接文件旁写出的标记文件后缀 (collectHistoryUrls / shardRunner 写出，delHistory --follow 据此结束)
+DONE_MARKER_SUFFIX = '.done'
+
+
+# --- 爬取断点状态 (SQLite) ---
+class CrawlState:
+    """
+    持久化 collectHistoryUrls 的爬取进度，用于 --resume 断点续爬。
+
+    包含：
+    1. frontier: 已发现但尚未处理完成的页面 URL。
+    2. visited: 已处理完成的页面 URL。
+    3. 已输出的“版本历史记录”链接：由 linkStore.LinkStore 按 (列表, 项目 ID) 紧凑存储并去重，
+       同时保存页面显示的大小，可还原为纯文本链接或 JSONL 记录。
+    4. failed: 重试次数用尽仍失败的页面及最后一次错误。这些页面同时保留在 frontier 中，
+       其所在子树不会被静默丢弃，--resume 时会重新处理；处理成功后从 failed 中移除。
+
+    每处理完一个页面调用一次 complete_page()，在同一个事务中把该页面从 frontier 移到 visited，
+    把新发现的子页面加入 frontier，并记录新输出的链接，因此崩溃后状态总是一致的。
+    links.txt 以状态库为准：续爬时先根据已存储的链接重写 links.txt，再继续追加。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS frontier (url TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS visited (url TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS failed (url TEXT PRIMARY KEY, attempts INTEGER, error TEXT, updated_at REAL);
+        ''')
+        self.links = LinkStore(self.conn)
+        self._migrate_emitted()
+        self.conn.commit()
+
+    def _migrate_emitted(self):
+        """把旧版本状态文件中 emitted 表 (每行存完整链接) 的内容导入 LinkStore。"""
+        if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'emitted'").fetchone():
+            return
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(emitted)')}
+        line_column = 'line' if 'line' in columns else 'NULL'
+        for link, line in self.conn.execute(f'SELECT link, {line_column} FROM emitted ORDER BY seq').fetchall():
+            self.links.add(json.loads(line) if line and line.startswith('{') else {'url': link})
+        self.conn.execute('DROP TABLE emitted')
+
+    @classmethod
+    def fresh(cls, db_path: str) -> 'CrawlState':
+        """删除旧的状态文件并创建一个空的状态库。"""
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        return cls(db_path)
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def load_frontier(self) -> list[str]:
+        return [row[0] for row in self.conn.execute('SELECT url FROM frontier')]
+
+    def load_visited(self) -> set[str]:
+        return {row[0] for row in self.conn.execute('SELECT url FROM visited')}
+
+    def load_failed(self) -> list[tuple[str, int, str]]:
+        """重试次数用尽的页面: [(url, 尝试次数, 最后一次错误)]。"""
+        return self.conn.execute('SELECT url, attempts, error FROM failed ORDER BY updated_at').fetchall()
+
+    def record_failure(self, url: str, attempts: int, error: str):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO failed (url, attempts, error, updated_at) VALUES (?, ?, ?, ?)',
+                              (url, attempts, error, time.time()))
+
+    def count_emitted(self) -> int:
+        return self.links.count()
+
+    def iter_emitted(self, output_format: str = 'txt'):
+        """按写入顺序逐条返回已输出的行 (游标流式读取，不一次性载入内存)。"""
+        yield from self.links.iter_lines(output_format)
+
+    def add_frontier(self, urls: list[str]):
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO frontier (url) VALUES (?)', [(u,) for u in urls])
+
+    def complete_page(self, url: str, new_pages: list[str], records: list[dict]) -> list[dict]:
+        """
+        在一个事务中记录页面处理完成。records 为该页面的链接记录 (stormanRows.to_record，至少含 url)。
+
+        Returns:
+            此前从未输出过的记录 (调用方只需把这些写入输出文件)。
+        """
+        with self.conn:
+            self.conn.execute('DELETE FROM frontier WHERE url = ?', (url,))
+            self.conn.execute('INSERT OR IGNORE INTO visited (url) VALUES (?)', (url,))
+            self.conn.execute('DELETE FROM failed WHERE url = ?', (url,))
+            self.conn.executemany('INSERT OR IGNORE INTO frontier (url) VALUES (?)', [(u,) for u in new_pages])
+            return [record for record in records if self.links.add(record)]
@@ -1,248 +1,497 @@
+import argparse
 import asyncio
+import heapq
 import os
-import contextlib
-import shutil
+import random
 import time
 from datetime import datetime
-from playwright.async_api import async_playwright, BrowserContext, Dialog
-
-# --- 浏览器路径配置 (来自 demo) ---
-THORIUM_PATH = r"C:\Users\Administrator\AppData\Local\Thorium\Application\thorium.exe"
-CHROME_PATH = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
-
-
-# --- 浏览器会话管理函数 (来自 demo) ---
-@contextlib.asynccontextmanager
-async def get_async_browser_session(playwright: async_playwright) -> BrowserContext:
-    """
-    一个 ASYNC 上下文管理器，用于：
-    1. 优先尝试连接 Thorium(9222)，失败则尝试 Chrome(9223)。
-    2. 如果使用 Chrome，则异步复制默认 User Data 到 User Data2 (如果不存在) 并使用。
-    3. 如果连接失败，则异步启动对应的浏览器新实例。
-    4. 自动关闭由本脚本启动的浏览器进程。
-    """
-    browser_process = None
-    context = None
-    launch_user_data_dir = None
-
-    # 1. 确定要使用的浏览器和端口
-    if os.path.exists(THORIUM_PATH):
-        exec_path = THORIUM_PATH
-        debug_port = 9222
-        browser_name = "Thorium"
-    elif os.path.exists(CHROME_PATH):
-        exec_path = CHROME_PATH
-        debug_port = 9223
-        browser_name = "Chrome"
-
-        # --- MODIFIED: Chrome User Data 复制逻辑 (使用 asyncio.to_thread) ---
-        try:
-            default_user_data_src = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Google', 'Chrome',
-                                                 'User Data')
-            copied_user_data_dest = os.path.join(os.path.expanduser('~'), 'AppData', 'Local', 'Google', 'Chrome',
-                                                 'User Data2')
-
-            if not os.path.exists(copied_user_data_dest):
-                print(f"未找到 'User Data2' 目录。")
-                print(f"正在从默认配置复制，这可能需要几分钟时间...")
-                print(f"源: {default_user_data_src}")
-                print(f"目标: {copied_user_data_dest}")
-
-                # <--- MODIFIED: 使用 to_thread 运行阻塞的 I/O 操作 ---
-                start_copy_time = time.time()
-                await asyncio.to_thread(
-                    shutil.copytree,
-                    default_user_data_src,
-                    copied_user_data_dest,
-                    ignore=shutil.ignore_patterns('lockfile', '*.lock')
-                )
-                end_copy_time = time.time()
-                print(f"复制完成。耗时: {end_copy_time - start_copy_time:.2f} 秒")
-            else:
-                print(f"已找到 'User Data2' 目录，将直接使用。")
-
-            launch_user_data_dir = copied_user_data_dest
-
-        except Exception as copy_error:
-            print(f"\n[严重错误] 复制 Chrome User Data 失败: {copy_error}")
-            print("请确保 Chrome 浏览器已完全关闭 (包括任务管理器中的后台进程)，然后删除 'User Data2' 目录重试。")
-            raise copy_error
-        # --- 复制逻辑结束 ---
-
-    else:
-        print(f"错误: Thorium 和 Chrome 路径均未找到。")
-        print(f"Thorium 路径: {THORIUM_PATH}")
-        print(f"Chrome 路径: {CHROME_PATH}")
-        raise FileNotFoundError("未找到 Thorium 或 Chrome 浏览器。")
-
-    print(f"将使用 {browser_name} (端口: {debug_port})")
+from playwright.async_api import async_playwright, Error as PlaywrightError, Response
 
-    try:
-        # 2. 优先尝试连接
-        try:
-            print(f"正在尝试连接到 http://localhost:{debug_port}...")
-            # <--- MODIFIED: 使用 async 版本的 connect_over_cdp ---
-            browser = await playwright.chromium.connect_over_cdp(f"http://localhost:{debug_port}")
-            context = browser.contexts[0]
-            print("连接成功！将使用已打开的浏览器实例。")
+from adaptiveLimiter import AdaptiveLimiter, HttpStatusError, ThrottledError, check_throttled
+from browserSession import add_browser_arguments, get_async_browser_session, PagePool, ResourceStats
+from crawlState import DONE_MARKER_SUFFIX
+from deleteLedger import DeleteLedger
+from metrics import METRICS, add_metrics_arguments, metrics_reporting
+from pickk import should_keep
+from retryPolicy import RetryPolicy, add_retry_arguments, build_retry_policy
+from stormanRows import format_size, parse_link_line, reclaimable_bytes
 
-        except Exception as e:
-            # 3. 连接失败，则启动新实例
-            print(f"连接失败 ({e})。")
-            print(f"（提示：如果浏览器已打开，请确保它是用 --remote-debugging-port={debug_port} 启动的）")
-            print(f"正在启动一个新的 {browser_name} 实例...")
+try:
+    from sharepointHttp import create_http_session, delete_all_versions_over_http, fetch_version_summary
+except ImportError:  # aiohttp 未安装时仅 playwright 后端可用
+    create_http_session = delete_all_versions_over_http = fetch_version_summary = None
 
-            # <--- MODIFIED: 准备启动参数 ---
-            launch_args = [exec_path, f"--remote-debugging-port={debug_port}"]
 
-            if browser_name == "Chrome" and launch_user_data_dir:
-                launch_args.append(f"--user-data-dir={launch_user_data_dir}")
-                print(f"使用复制的用户数据目录: {launch_user_data_dir}")
+# --- 删除完成检测: deleteOnClick() 触发的回发请求 ---
+def is_delete_postback(response: Response) -> bool:
+    """
+    deleteOnClick() 在弹窗确认后会提交表单 (POST 回 versions.aspx)，其响应即删除完成的信号。
+    只匹配表单回发本身 (document 类型)：页面上的 CSOM、遥测等 XHR/fetch POST 不能当作删除完成，
+    否则标签页提前归还，下一次 goto 会中断真正的回发。
+    """
+    request = response.request
+    return (request.method == 'POST' and request.resource_type == 'document'
+            and 'versions.aspx' in request.url.lower())
 
-            # <--- MODIFIED: 使用 asyncio.create_subprocess_exec 启动进程 ---
-            browser_process = await asyncio.create_subprocess_exec(*launch_args)
 
-            print("等待浏览器启动...")
-            # <--- MODIFIED: 使用 asyncio.sleep ---
-            await asyncio.sleep(3)  # 等待进程启动
+# --- 新的链接处理函数 (使用 Playwright) ---
+async def open_link_and_trigger_delete(
+        url: str,
+        page_pool: PagePool,
+        index: int,
+        counter_lock: asyncio.Lock,
+        limiter: AdaptiveLimiter,
+        latencies: list[float] | None = None,
+        ledger: DeleteLedger | None = None,
+        policy: RetryPolicy | None = None
+) -> int:
+    """
+    从标签页池借用一个标签页打开链接，触发 deleteOnClick()，弹窗由标签页池统一自动接受。
 
-            # 再次尝试连接
-            browser = await playwright.chromium.connect_over_cdp(f"http://localhost:{debug_port}")
-            context = browser.contexts[0]
-            print(f"新实例连接成功！")
+    不再固定等待 3 秒，而是等待删除回发的响应 (最多 policy.delete_timeout 秒)，
+    并把从触发到回发完成的耗时 (秒) 追加到 latencies。
+    并发由 limiter 控制；被限流时等待控制器暂停结束后重试，最多 policy.max_throttle_attempts 次。
+    提供 ledger 时把成功/失败 (含错误信息) 记入删除台账。打开页面的超时取自 policy。
+    """
+    policy = policy or RetryPolicy()
+    try:
+        for attempt in range(policy.max_throttle_attempts):
+            try:
+                async with limiter.slot(), page_pool.page() as page:
+                    # 访问网页
+                    with METRICS.phase('goto'):
+                        response = await page.goto(url, timeout=policy.goto_timeout * 1000, wait_until='domcontentloaded')
+                        if response is not None:
+                            check_throttled(response.status, response.headers)
+
+                    # 直接触发deleteOnClick函数，并等待其回发响应作为完成信号
+                    start_time = time.perf_counter()
+                    with METRICS.phase('delete'):
+                        async with page.expect_response(is_delete_postback, timeout=policy.delete_timeout * 1000) as response_info:
+                            try:
+                                await page.evaluate("deleteOnClick();")
+                            except PlaywrightError as e:
+                                # 回发引起页面跳转时 evaluate 可能报 "Execution context was destroyed"，属正常情况
+                                if 'Execution context was destroyed' not in str(e):
+                                    raise
+                        response = await response_info.value
+                        check_throttled(response.status, response.headers)
+                        if response.status >= 400:
+                            raise HttpStatusError(response.status, f"删除回发返回 HTTP {response.status}")
+                    latency = time.perf_counter() - start_time
+                break
+            except ThrottledError as e:
+                print(f'链接 {url} {e}，稍后重试 ({limiter.status_text()})')
+                if attempt == policy.max_throttle_attempts - 1:
+                    raise
+
+        if latencies is not None:
+            latencies.append(latency)
+        METRICS.inc('links_deleted')
+
+        if ledger is not None:
+            ledger.record(url, ok=True)
 
-        # 4. 'yield' 上下文，供 with 语句块使用
-        yield context
+        # 更新计数器
+        async with counter_lock:
+            return 1  # 表示成功处理 1 个
 
     except Exception as e:
-        print(f"\n[浏览器管理错误] 连接或启动 {browser_name} 时失败: {e}")
-        raise
-
-    finally:
-        # 5. 自动关闭 *由本脚本启动* 的浏览器进程
-        if browser_process:
-            print(f"\n任务结束，正在关闭由脚本启动的 {browser_name} 浏览器...")
-            browser_process.terminate()  # 终止浏览器进程
-            # <--- MODIFIED: 使用 await browser_process.wait() ---
-            await browser_process.wait()
-            print("浏览器已关闭。")
-        else:
-            print("\n任务结束。由于连接到的是现有浏览器实例，故不关闭浏览器。")
+        METRICS.inc('links_failed')
+        print(f'处理链接 第{index}条 {url} 时发生错误：{e}')
+        if ledger is not None:
+            ledger.record(url, ok=False, error=str(e))
+        return 0  # 表示处理失败 0 个
 
 
-# --- 新的链接处理函数 (使用 Playwright) ---
-async def open_link_and_trigger_delete(
+# --- HTTP 后端: 不打开标签页，直接提交删除回发 ---
+async def post_delete_over_http(
         url: str,
-        browser_context: BrowserContext,
+        http_session,
         index: int,
-        total: int,
         counter_lock: asyncio.Lock,
-        semaphore: asyncio.Semaphore
+        limiter: AdaptiveLimiter,
+        latencies: list[float] | None = None,
+        ledger: DeleteLedger | None = None,
+        policy: RetryPolicy | None = None,
+        skip_clean: bool = False
 ) -> int:
     """
-    使用 Playwright 打开链接，触发 deleteOnClick()，并自动处理弹窗。
+    使用 aiohttp 会话 (复用浏览器 Cookie) 直接完成 versions.aspx 的“删除所有版本”回发。
+    提供 ledger 时把成功/失败 (含错误信息) 记入删除台账。每个请求的超时取自 policy。
+    skip_clean=True 时只有当前版本的链接不提交回发 (计入 links_clean，同样视为成功)。
     """
-    page = None
+    policy = policy or RetryPolicy()
     try:
-        # 在创建页面前获取信号量
-        async with semaphore:
-            print(f'\033[2K\r正在处理链接：第{index}/{total}条 (等待信号量...)', end='', flush=True)
-            page = await browser_context.new_page()
-
-            # --- 关键: 设置事件监听器以自动接受弹窗 ---
-            async def handle_dialog(dialog: Dialog):
-                # --- MODIFIED: 添加 try/except 来处理 "No dialog is showing" 错误 ---
-                try:
-                    await dialog.accept()
-                except Exception as e:
-                    # 忽略 "No dialog is showing" 错误，这可能在竞态条件下发生
-                    print(f'\n[警告] 尝试 accept() 一个已消失的弹窗 (已忽略): {e}')
+        for attempt in range(policy.max_throttle_attempts):
+            try:
+                async with limiter.slot():
+                    start_time = time.perf_counter()
+                    with METRICS.phase('http_delete'):
+                        posted = await delete_all_versions_over_http(http_session, url, policy.http_timeout,
+                                                                     skip_clean)
+                    latency = time.perf_counter() - start_time
+                break
+            except ThrottledError as e:
+                print(f'链接 {url} {e}，稍后重试 ({limiter.status_text()})')
+                if attempt == policy.max_throttle_attempts - 1:
+                    raise
+
+        if not posted:
+            METRICS.inc('links_clean')
+        else:
+            if latencies is not None:
+                latencies.append(latency)
+            METRICS.inc('links_deleted')
 
-            page.on('dialog', handle_dialog)
+        if ledger is not None:
+            ledger.record(url, ok=True)
 
-            # 访问网页
-            print(f'\033[2K\r正在处理链接：第{index}/{total}条 (正在打开 {url[:50]}...)', end='', flush=True)
-            await page.goto(url, timeout=60000, wait_until='domcontentloaded')
+        async with counter_lock:
+            return 1
 
-            # 直接触发deleteOnClick函数
-            await page.evaluate("deleteOnClick();")
+    except Exception as e:
+        METRICS.inc('links_failed')
+        print(f'处理链接 第{index}条 {url} 时发生错误：{e}')
+        if ledger is not None:
+            ledger.record(url, ok=False, error=str(e))
+        return 0
 
-            # 等待弹窗处理和后续操作
-            await asyncio.sleep(3)  # 等待删除操作完成
 
-            print(f'\033[2K\r已处理链接：第{index}/{total}条', end='', flush=True)
-            await page.close()
+# --- 预检查: 只读取 versions.aspx 的历史版本数量 ---
+async def precheck_versions(url: str, http_session, limiter: AdaptiveLimiter,
+                            policy: RetryPolicy | None = None) -> tuple[int, int]:
+    """
+    删除前通过 HTTP 读取 versions.aspx (不打开标签页、不弹窗)，返回 (历史版本数量, 历史版本合计字节数)。
+    只有当前版本的链接可以直接跳过，省去一次完整的页面加载与回发。被限流时等待控制器暂停结束后重试。
+    """
+    policy = policy or RetryPolicy()
+    for attempt in range(policy.max_throttle_attempts):
+        try:
+            async with limiter.slot():
+                with METRICS.phase('precheck'):
+                    return await fetch_version_summary(http_session, url, policy.http_timeout)
+        except ThrottledError as e:
+            print(f'链接 {url} {e}，稍后重试 ({limiter.status_text()})')
+            if attempt == policy.max_throttle_attempts - 1:
+                raise
+
+
+# --- 单条链接耗时统计 ---
+def print_latency_summary(latencies: list[float]):
+    if not latencies:
+        return
+    ordered = sorted(latencies)
 
-        # 更新计数器
-        async with counter_lock:
-            return 1  # 表示成功处理 1 个
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
 
-    except Exception as e:
-        print(f'\n处理链接 {url} 时发生错误：{e}')
-        return 0  # 表示处理失败 0 个
+    print(f"单条链接删除耗时: 平均 {sum(ordered) / len(ordered):.2f} 秒, "
+          f"P50 {percentile(0.5):.2f} 秒, P95 {percentile(0.95):.2f} 秒, 最大 {ordered[-1]:.2f} 秒")
+
+
+# --- 流式读取链接文件 ---
+async def read_links(file_path: str, follow: bool = False, poll_interval: float = 1.0, batch_bytes: int = 64 * 1024):
+    """
+    逐批惰性读取链接文件 (异步生成器)，内存占用与文件大小无关。
+
+    follow=True 时类似 tail -f：读到文件末尾后继续等待新写入的行，
+    直到 collectHistoryUrls 写出完成标记 (<file_path>.done) 且已读完全部内容。
+    """
+    done_marker = file_path + DONE_MARKER_SUFFIX
+    pending = ''  # 尚未写完 (没有换行符) 的半行
+    with open(file_path, 'r', encoding='utf-8') as file:
+        while True:
+            lines = await asyncio.to_thread(file.readlines, batch_bytes)
+            if not lines:
+                if not follow:
+                    break
+                # 先检查完成标记再读一次，避免漏掉标记写出前的最后几行
+                finished = os.path.exists(done_marker)
+                lines = await asyncio.to_thread(file.readlines, batch_bytes)
+                if not lines:
+                    if finished:
+                        break
+                    await asyncio.sleep(poll_interval)
+                    continue
+            lines[0] = pending + lines[0]
+            pending = ''
+            if follow and not lines[-1].endswith('\n'):
+                pending = lines.pop()
+            for line in lines:
+                link = line.strip()
+                if link:
+                    yield link
+    if pending.strip():
+        yield pending.strip()
+
+
+async def feed_links(links, queue: asyncio.Queue, worker_count: int) -> int:
+    """
+    把链接逐条放入有界队列 (队列满时等待，形成背压)，最后为每个 worker 放入一个结束标记 None。
+
+    Returns:
+        放入队列的链接数量。
+    """
+    index = 0
+    try:
+        async for link in links:
+            index += 1
+            await queue.put((index, link))
     finally:
-        if page and not page.is_closed():
-            await page.close()  # 确保页面在出错时也能关闭
+        for _ in range(worker_count):
+            await queue.put(None)
+    return index
+
+
+async def iter_async(items):
+    """把普通可迭代对象包装为异步生成器，供 feed_links 使用。"""
+    for item in items:
+        yield item
+
+
+async def by_reclaimable_bytes(records):
+    """
+    读入全部记录放入优先队列 (堆)，按可释放空间从大到小依次产出，配额紧张时先处理收益最大的链接。
+    需要读完整个文件才能排序，因此不能与 --follow 同时使用。
+    """
+    heap = []
+    without_version_size = 0
+    async for record in records:
+        without_version_size += record.get('version_size') is None
+        heapq.heappush(heap, (-reclaimable_bytes(record), len(heap), record))
+    print(f"已按可释放空间排序 {len(heap)} 条链接，"
+          f"预计共可释放 {format_size(-sum(item[0] for item in heap))}。")
+    if without_version_size * 2 > len(heap):
+        print(f"警告: {without_version_size} 条记录没有历史版本大小 (页面可能只显示一个大小列，或链接文件不是 jsonl 格式)，"
+              f"这些链接按总大小排序，上面的预计值是上限。")
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+
+async def run_delete_workers(queue: asyncio.Queue, worker_count: int, process_link) -> int:
+    """
+    启动固定数量的 worker 消费队列中的 (index, link)，对每条链接调用 process_link(link, index)。
+    link 可以是链接字符串，也可以是 parse_link_line 解析出的记录，由 process_link 自行解释。
+
+    Returns:
+        成功处理的链接数量。
+    """
+    processed = 0
+
+    async def worker():
+        nonlocal processed
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            index, link = item
+            result = await process_link(link, index)
+            processed += result
+
+    await asyncio.gather(*(worker() for _ in range(worker_count)))
+    return processed
 
 
 # --- 新的主函数 ---
-async def main(file_path):
+async def main(file_path, backend='playwright', concurrency_limit=15, initial_concurrency=4,
+               follow=False, ledger_path='delete_ledger.db', rerun=False, max_attempts=3, retry_backoff=30.0,
+               apply_filter=False, by_size=False, storage_state=None, full_profile_copy=False,
+               lean=False, measure=False, metrics_interval=10.0, metrics_file=None, metrics_port=None,
+               retry_policy=None, precheck=False, dry_run=False):
     total_processed = 0
-    links = []
-
-    # 1. 读取链接文件
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            links = [line.strip() for line in file.readlines() if line.strip()]
-        total_links = len(links)
-        if total_links == 0:
-            print(f"文件 {file_path} 为空，无需处理。")
+    freed_bytes = 0
+    dry_run_links = 0
+    dry_run_versions = 0
+    dry_run_bytes = 0
+    total_links = 0
+    skipped_done = 0
+    skipped_filtered = 0
+    latencies = []
+
+    # 1. 检查链接文件 (不再一次性读入，边读边处理)
+    if not os.path.exists(file_path):
+        if not follow:
+            print(f"错误: 未找到链接文件 {file_path}")
             return
-    except FileNotFoundError:
-        print(f"错误: 未找到链接文件 {file_path}")
-        return
-    except Exception as e:
-        print(f"读取文件 {file_path} 时出错: {e}")
+        print(f"等待 collectHistoryUrls 创建 {file_path}...")
+        while not os.path.exists(file_path):
+            await asyncio.sleep(1)
+
+    if (backend == 'http' or precheck or dry_run) and create_http_session is None:
+        print("HTTP 后端、--precheck 与 --dry-run 需要 aiohttp，请先执行: pip install aiohttp")
         return
+    if dry_run:
+        print("试运行: 只读取各链接的历史版本数量与大小，不执行删除。")
 
-    print(f"文件读取完毕，共 {total_links} 条链接待处理。")
+    ledger = DeleteLedger(ledger_path)
+    run_started = ledger.run_started
+    if rerun:
+        print(f"重跑模式: 跳过删除台账 {ledger_path} 中已成功的链接。")
 
     try:
-        async with async_playwright() as p:
+        async with async_playwright() as p, metrics_reporting(metrics_interval, metrics_file, metrics_port):
             print("正在启动 Playwright 并获取浏览器会话...")
-            async with get_async_browser_session(p) as browser_context:
+            async with get_async_browser_session(p, storage_state=storage_state,
+                                                 full_profile_copy=full_profile_copy,
+                                                 headless=lean) as browser_context:
                 print("浏览器会话已获取，开始处理链接...")
 
                 counter_lock = asyncio.Lock()
 
-                # 设置并发上限
-                concurrency_limit = 15
-                semaphore = asyncio.Semaphore(concurrency_limit)
-                print(f"并发标签页上限设置为: {concurrency_limit}")
-
-                tasks = []
-                for i, url in enumerate(links, 1):
-                    tasks.append(asyncio.create_task(
-                        open_link_and_trigger_delete(url, browser_context, i, total_links, counter_lock, semaphore)
-                    ))
+                # 设置并发上限，实际并发由 AIMD 控制器在 [1, concurrency_limit] 内动态调整
+                limiter = AdaptiveLimiter(initial_concurrency, 1, concurrency_limit)
+                print(f"并发上限设置为: {concurrency_limit}，初始并发: {limiter.current_limit} (后端: {backend})")
+
+                http_session = None
+                if backend == 'http' or precheck or dry_run:
+                    http_session = await create_http_session(browser_context, concurrency_limit)
+
+                # 标签页池: 复用标签页，容量即并发标签页上限
+                page_pool = PagePool(browser_context, concurrency_limit)
+
+                # --- NEW: 精简模式拦截无用资源；--measure 只统计流量，便于与精简模式对比 ---
+                resource_stats = None
+                if lean or measure:
+                    resource_stats = await ResourceStats.attach(browser_context, block=lean)
+
+                async def process_link(record, index):
+                    nonlocal freed_bytes, dry_run_links, dry_run_versions, dry_run_bytes
+                    url = record['url']
+                    # --- NEW: 预检查跳过只有当前版本的链接 (http 后端在删除请求中顺带检查)；--dry-run 只统计 ---
+                    if dry_run or (precheck and backend == 'playwright'):
+                        try:
+                            versions, history_bytes = await precheck_versions(url, http_session, limiter,
+                                                                              retry_policy)
+                        except Exception as e:
+                            if dry_run:
+                                METRICS.inc('links_failed')
+                                print(f'检查链接 第{index}条 {url} 时发生错误：{e}')
+                                return 0
+                            print(f'预检查链接 第{index}条 {url} 失败 ({e})，直接尝试删除。')
+                        else:
+                            if not versions:
+                                METRICS.inc('links_clean')
+                                if not dry_run:
+                                    ledger.record(url, ok=True)
+                                return 1
+                            if dry_run:
+                                dry_run_links += 1
+                                dry_run_versions += versions
+                                dry_run_bytes += history_bytes
+                                METRICS.inc('bytes_to_free', history_bytes)
+                                return 1
+                    if backend == 'http':
+                        result = await post_delete_over_http(url, http_session, index, counter_lock, limiter,
+                                                             latencies, ledger, retry_policy, precheck)
+                    else:
+                        result = await open_link_and_trigger_delete(url, page_pool, index, counter_lock, limiter,
+                                                                    latencies, ledger, retry_policy)
+                    if result and reclaimable_bytes(record):
+                        freed_bytes += reclaimable_bytes(record)
+                        METRICS.inc('bytes_freed', reclaimable_bytes(record))
+                    return result
+
+                async def pending_links(lines):
+                    # --filter: 按 pickk 的规则跳过无需处理的文件; --rerun: 跳过台账中已成功的链接
+                    nonlocal skipped_done, skipped_filtered
+                    async for line in lines:
+                        if apply_filter and not should_keep(line):
+                            skipped_filtered += 1
+                            continue
+                        record = parse_link_line(line)
+                        if rerun and ledger.is_done(record['url']):
+                            skipped_done += 1
+                            continue
+                        yield record
+
+                async def run_pass(links):
+                    queue = asyncio.Queue(maxsize=concurrency_limit * 2)
+                    feeder = asyncio.create_task(feed_links(links, queue, concurrency_limit))
+                    processed = await run_delete_workers(queue, concurrency_limit, process_link)
+                    return processed, await feeder
 
-                # 等待所有任务完成
-                results = await asyncio.gather(*tasks)
-                total_processed = sum(results)
+                try:
+                    # 读取 -> 有界队列 -> 固定数量的 worker，读到第一行即开始处理
+                    if follow:
+                        print(f"跟随模式: 持续读取 {file_path} 的新增链接，直到出现完成标记。")
+                    records = pending_links(read_links(file_path, follow))
+                    if by_size:
+                        records = by_reclaimable_bytes(records)
+                    total_processed, total_links = await run_pass(records)
+
+                    # 失败链接按指数退避分轮重试，直到成功或达到 max_attempts 次 (试运行不写台账，无需重试)
+                    retry_round = 0
+                    while not dry_run and (failed := ledger.failed_links(max_attempts, run_started)):
+                        delay = retry_backoff * 2 ** retry_round * random.uniform(0.8, 1.2)
+                        print(f"\n{len(failed)} 条链接处理失败，{delay:.0f} 秒后进行第 {retry_round + 1} 轮重试...")
+                        await asyncio.sleep(delay)
+                        processed, _ = await run_pass(iter_async({'url': url} for url in failed))
+                        total_processed += processed
+                        retry_round += 1
+                finally:
+                    await page_pool.close()
+                    if http_session is not None:
+                        await http_session.close()
+                    if resource_stats is not None:
+                        await resource_stats.detach()
+                        print(f"\n{resource_stats.summary_text(page_pool)}")
 
     except Exception as e:
         print(f"\n发生致命错误: {e}")
 
     print(f'\n{datetime.now().strftime("%Y-%m-%d %H:%M:%S")} 清除完毕！')
-    print(f"总共成功处理了 {total_processed} / {total_links} 个链接。")
+    print(f"总共成功{'检查' if dry_run else '处理'}了 {total_processed} / {total_links} 个链接。")
+    if clean_links := METRICS.counters.get('links_clean'):
+        print(f"预检查: {clean_links:g} 个链接只有当前版本，已跳过。")
+    if dry_run:
+        print(f"试运行: {dry_run_links} 个链接有历史版本，将删除 {dry_run_versions} 个历史版本，"
+              f"约 {format_size(dry_run_bytes)} (按版本页面显示的大小)。未执行任何删除。")
+    if freed_bytes:
+        print(f"按页面显示的历史版本大小计算 (没有该列时按总大小，为上限)，累计释放约 {format_size(freed_bytes)}。")
+    if skipped_done:
+        print(f"已跳过 {skipped_done} 个此前已成功处理的链接。")
+    if skipped_filtered:
+        print(f"已按 pickk 规则跳过 {skipped_filtered} 个链接。")
+    print(f"删除台账 {ledger_path}: {ledger.summary()}")
+    ledger.close()
+    print_latency_summary(latencies)
 
 
 # --- 启动器 ---
 if __name__ == "__main__":
-    # 文件路径
-    file_path = 'links.txt'
+    parser = argparse.ArgumentParser(description='批量清除 OneDrive / SharePoint 文件的历史版本')
+    parser.add_argument('file_path', nargs='?', default='links.txt', help='链接文件 (默认 links.txt)')
+    parser.add_argument('--backend', choices=['playwright', 'http'], default='playwright',
+                        help='playwright: 在标签页中执行 deleteOnClick(); http: 复用浏览器 Cookie 直接提交回发 (需要 aiohttp)')
+    parser.add_argument('--concurrency', type=int, default=15, help='最大并发数量')
+    parser.add_argument('--initial-concurrency', type=int, default=4, help='初始并发数量 (随后自适应调整)')
+    parser.add_argument('--follow', action='store_true',
+                        help='跟随模式: 在 collectHistoryUrls 仍在写入时持续读取新增链接，直到其写出完成标记')
+    parser.add_argument('--ledger', default='delete_ledger.db', help='删除台账文件 (SQLite)')
+    parser.add_argument('--rerun', action='store_true', help='重跑模式: 跳过台账中已成功处理的链接')
+    parser.add_argument('--filter', action='store_true', help='按 pickk 的默认规则跳过无需处理的文件 (无需先运行 pickk.py)')
+    parser.add_argument('--max-attempts', type=int, default=3, help='每条链接的最大尝试次数 (含重试)')
+    parser.add_argument('--retry-backoff', type=float, default=30.0, help='第一轮重试前的等待秒数，之后每轮翻倍')
+    parser.add_argument('--by-size', action='store_true',
+                        help='按可释放空间从大到小处理 (需要 collectHistoryUrls --format jsonl 生成的记录文件)')
+    add_browser_arguments(parser)
+    parser.add_argument('--measure', action='store_true', help='只统计传输字节数与每页耗时 (不拦截)，用于对比 --lean')
+    parser.add_argument('--precheck', action='store_true',
+                        help='删除前通过 HTTP 读取版本页面，跳过只有当前版本的链接 (需要 aiohttp；http 后端不产生额外请求)')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='试运行: 只读取各链接的历史版本数量与大小并汇总，不执行删除 (需要 aiohttp)')
+    add_retry_arguments(parser, crawl=False, delete=True)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    if args.by_size and args.follow:
+        parser.error('--by-size 需要先读完整个文件排序，不能与 --follow 同时使用')
 
     # 运行主函数
     # 注意: user_data_dirs 列表不再需要，因为 get_async_browser_session 会自动处理
-    asyncio.run(main(file_path))
+    asyncio.run(main(args.file_path, args.backend, args.concurrency, args.initial_concurrency,
+                     args.follow, args.ledger, args.rerun, args.max_attempts, args.retry_backoff,
+                     args.filter, args.by_size, args.storage_state, args.full_profile_copy,
+                     args.lean, args.measure, args.metrics_interval, args.metrics_file, args.metrics_port,
+                     build_retry_policy(args), args.precheck, args.dry_run))
 
@@ -0,0 +1,98 @@
+import sqlite3
+import time
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+# --- 删除台账 (SQLite) ---
+class DeleteLedger:
+    """
+    持久化记录每条链接的删除结果：状态、尝试次数、最后一次错误与时间。
+
+    - attempts 为累计尝试次数 (仅供查看)；run_attempts 为本次运行 (run_started 之后) 的尝试次数，
+      重试上限 (delHistory --max-attempts) 按本次运行计算，之前运行用尽的重试次数不会带到下一次运行。
+
+    - 结果先缓存在内存中，每 batch_size 条或每 flush_interval 秒批量提交一次，避免每条链接一次磁盘同步。
+    - 重新运行时 (delHistory --rerun) 跳过状态为 done 的链接，只处理失败和未处理的链接。
+    - 删除历史版本本身是幂等的：若在删除成功后、提交台账前崩溃，该链接下次会被再处理一次，
+      但不会产生额外影响；台账保证每条链接在成功后只被记录为 done 一次。
+    """
+
+    def __init__(self, db_path: str, batch_size: int = 200, flush_interval: float = 5.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS links (
+                url TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                run_attempts INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        if 'run_attempts' not in {row[1] for row in self.conn.execute('PRAGMA table_info(links)')}:
+            self.conn.execute('ALTER TABLE links ADD COLUMN run_attempts INTEGER NOT NULL DEFAULT 0')
+        self.conn.commit()
+        self.run_started = time.time()
+        self._pending: dict[str, tuple[str, str | None, float, int]] = {}  # url -> (status, error, time, 次数)
+        self._last_flush = time.monotonic()
+
+    def record(self, url: str, ok: bool, error: str | None = None):
+        """记录一次处理结果 (缓存，按批提交)。"""
+        _, _, _, attempts = self._pending.get(url, (None, None, 0.0, 0))
+        self._pending[url] = (STATUS_DONE if ok else STATUS_FAILED, error, time.time(), attempts + 1)
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany('''
+                    INSERT INTO links (url, status, attempts, last_error, updated_at, run_attempts)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(url) DO UPDATE SET
+                        status = excluded.status,
+                        attempts = links.attempts + excluded.attempts,
+                        last_error = excluded.last_error,
+                        updated_at = excluded.updated_at,
+                        run_attempts = CASE WHEN links.updated_at >= ? THEN links.run_attempts ELSE 0 END
+                                       + excluded.run_attempts
+                ''', [(url, status, attempts, error, at, attempts, self.run_started)
+                      for url, (status, error, at, attempts) in self._pending.items()])
+            self._pending.clear()
+        self._last_flush = time.monotonic()
+
+    def is_done(self, url: str) -> bool:
+        if url in self._pending:
+            return self._pending[url][0] == STATUS_DONE
+        row = self.conn.execute('SELECT status FROM links WHERE url = ?', (url,)).fetchone()
+        return row is not None and row[0] == STATUS_DONE
+
+    def done_since(self, url: str, since: float) -> bool:
+        """链接在 since (time.time() 时间戳) 之后被成功处理过 (供增量快照确认删除已完成)。"""
+        if url in self._pending:
+            status, _, at, _ = self._pending[url]
+            return status == STATUS_DONE and at >= since
+        row = self.conn.execute('SELECT status, updated_at FROM links WHERE url = ?', (url,)).fetchone()
+        return row is not None and row[0] == STATUS_DONE and row[1] >= since
+
+    def failed_links(self, max_attempts: int, since: float = 0.0) -> list[str]:
+        """since (time.time() 时间戳) 之后失败、且本次运行的尝试次数尚未达到 max_attempts 的链接。"""
+        self.flush()
+        return [row[0] for row in self.conn.execute(
+            'SELECT url FROM links WHERE status = ? AND run_attempts < ? AND updated_at >= ? ORDER BY updated_at',
+            (STATUS_FAILED, max_attempts, since))]
+
+    def summary(self) -> dict[str, int]:
+        self.flush()
+        return dict(self.conn.execute('SELECT status, COUNT(*) FROM links GROUP BY status').fetchall())
+
+    def close(self):
+        self.flush()
+        self.conn.close()
@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from deleteLedger import DeleteLedger
+
+
+def row_fingerprint(row: dict) -> str:
+    """页面上显示的一行 (名称、总大小、历史版本大小、修改时间等各列文本) 作为该行的指纹。"""
+    return '\x1f'.join(row['cells'])
+
+
+def folder_of(storman_url: str) -> str:
+    """storman.aspx 地址对应的文件夹路径 (root 参数，如 "Shared Documents/a/b")。"""
+    return parse_qs(urlsplit(storman_url).query).get('root', [''])[0]
+
+
+def ancestors(folder: str) -> list[str]:
+    """文件夹自身及其所有上级文件夹的路径。"""
+    parts = folder.split('/')
+    return ['/'.join(parts[:i]) for i in range(len(parts), 0, -1)]
+
+
+# --- 增量爬取的文件夹快照 (SQLite) ---
+class FolderSnapshot:
+    """
+    跨运行保存 storman.aspx 中每个文件夹行与文件行的指纹，供每周增量重扫使用。
+
+    - storman.aspx 中文件夹的大小是其整个子树的合计，因此父页面中某个子文件夹行 (大小、修改时间等) 与快照
+      相同，即可认为该子树未变化，不再打开；文件行不变的文件不再输出“版本历史记录”链接。
+    - 本次运行看到的有变化的行先写入 pending 表 (连同所在文件夹与看到的时间)。只有确认已处理的行才由 promote()
+      合并到 entries：文件行要求删除台账中该链接在看到之后被成功处理；文件夹行要求其子树中没有未确认的文件。
+      删除失败或从未运行 delHistory 的文件及其上级文件夹因此不会进入快照，下一次增量运行会再次输出。
+    - 子文件夹行在父页面被读取时就已暂存，早于该子文件夹本身被访问，因此只有完整结束且没有失败页面的运行
+      才会 mark_complete()。下一次运行开始时 begin_run()：有完成标记则 promote()，否则 (中断、崩溃或有失败页面)
+      丢弃 pending，未访问完的子树下次重新爬取；续爬 (--resume) 保留 pending，续爬完成后再标记。
+    - collectHistoryUrls / shardRunner 在下一次增量运行开始时 promote() 上一次的 pending
+      (两次运行之间执行了 delHistory)；collectAndDelete 在删除结束后立即 promote()。
+    - 未重新访问的 (被跳过的) 子树保留原有记录。
+    - 删除历史版本后文件与其上级文件夹的大小都会变小，所以清理后的下一次运行会把这些路径视为有变化再爬一次，
+      之后就只与真正的变动量相关。被 delHistory --filter 跳过的链接不会出现在台账中，请改用爬取时的剪枝参数。
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        if 'kind' not in {row[1] for row in self.conn.execute('PRAGMA table_info(pending)')}:
+            self.conn.execute('DROP TABLE IF EXISTS pending')  # 旧版本的 pending 表没有所在文件夹等列
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS entries (url TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, updated_at REAL);
+            CREATE TABLE IF NOT EXISTS pending (
+                url TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, kind TEXT NOT NULL, folder TEXT NOT NULL,
+                staged_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        ''')
+        self.conn.commit()
+        self.skipped_folders = 0
+        self.unchanged_files = 0
+
+    def is_empty(self) -> bool:
+        return self.conn.execute('SELECT 1 FROM entries LIMIT 1').fetchone() is None
+
+    def reset_pending(self) -> int:
+        """丢弃尚未合并的指纹 (上一次运行未完整结束或本次运行有失败页面时)，返回丢弃的行数。"""
+        with self.conn:
+            self.conn.execute("DELETE FROM meta WHERE key = 'complete'")
+            return self.conn.execute('DELETE FROM pending').rowcount
+
+    def mark_complete(self):
+        """爬取完整结束且没有失败页面时调用：pending 中的指纹可在确认删除后并入快照。"""
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('complete', ?)", (str(time.time()),))
+
+    def is_complete(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM meta WHERE key = 'complete'").fetchone() is not None
+
+    def begin_run(self, ledger, resume: bool = False, needs_delete=None) -> tuple[int, int, int]:
+        """
+        新的运行开始时处理上一次运行暂存的指纹 (见类说明)。
+
+        Returns:
+            (合并的行数, 因删除未确认而保留的文件数, 因上一次运行未完整结束而丢弃的行数)
+        """
+        if resume:
+            with self.conn:
+                self.conn.execute("DELETE FROM meta WHERE key = 'complete'")
+            return 0, 0, 0
+        if not self.is_complete():
+            return 0, 0, self.reset_pending()
+        return *self.promote(ledger, needs_delete), 0
+
+    def _changed(self, rows: list[dict], kind: str, folder_for) -> list[dict]:
+        changed = []
+        for row in rows:
+            previous = self.conn.execute('SELECT fingerprint FROM entries WHERE url = ?', (row['url'],)).fetchone()
+            if previous is None or previous[0] != row_fingerprint(row):
+                changed.append(row)
+        now = time.time()
+        # 只暂存有变化的行：未变化的行在快照中已是当前指纹
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO pending (url, fingerprint, kind, folder, staged_at) '
+                                  'VALUES (?, ?, ?, ?, ?)',
+                                  [(row['url'], row_fingerprint(row), kind, folder_for(row), now) for row in changed])
+        return changed
+
+    def filter_page(self, page_url: str, folder_rows: list[dict],
+                    feature_rows: list[dict]) -> tuple[list[dict], list[dict]]:
+        """
+        记录 page_url 页面上各行的指纹，并只返回新增或有变化的子文件夹行与文件行。
+
+        Returns:
+            (需要访问的子文件夹行, 需要输出的文件行)
+        """
+        changed_folders = self._changed(folder_rows, 'folder', lambda row: folder_of(row['url']))
+        changed_features = self._changed(feature_rows, 'file', lambda row: folder_of(page_url))
+        self.skipped_folders += len(folder_rows) - len(changed_folders)
+        self.unchanged_files += len(feature_rows) - len(changed_features)
+        return changed_folders, changed_features
+
+    def promote(self, ledger, needs_delete=None) -> tuple[int, int]:
+        """
+        把已确认处理的指纹合并到快照并清空 pending；未确认的行被丢弃，快照中保留其旧指纹 (或没有记录)，
+        因此下次运行会重新访问这些文件夹并再次输出这些文件。
+
+        Args:
+            ledger: DeleteLedger；为 None 时没有文件可确认，只合并子树中没有文件行的文件夹。
+            needs_delete: 可选的判断函数 (如 pickk.should_keep)；返回 False 的链接不需要删除，直接视为已确认。
+
+        Returns:
+            (合并的行数, 因删除未确认而保留的文件数)
+        """
+        if ledger is not None:
+            ledger.flush()
+        held: set[str] = set()
+        dirty: set[str] = set()
+        for url, folder, staged_at in self.conn.execute(
+                "SELECT url, folder, staged_at FROM pending WHERE kind = 'file'").fetchall():
+            if needs_delete is not None and not needs_delete(url):
+                continue
+            if ledger is None or not ledger.done_since(url, staged_at):
+                held.add(url)
+                dirty.update(ancestors(folder))
+        rows = [(url, fingerprint) for url, fingerprint, kind, folder in self.conn.execute(
+                    'SELECT url, fingerprint, kind, folder FROM pending').fetchall()
+                if url not in held and not (kind == 'folder' and folder in dirty)]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO entries (url, fingerprint, updated_at) VALUES (?, ?, ?)',
+                                  [(url, fingerprint, time.time()) for url, fingerprint in rows])
+            self.conn.execute('DELETE FROM pending')
+            self.conn.execute("DELETE FROM meta WHERE key = 'complete'")
+        return len(rows), len(held)
+
+    def summary_text(self) -> str:
+        return f"增量扫描: 跳过 {self.skipped_folders} 个未变化的子文件夹，{self.unchanged_files} 个未变化的文件。"
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+def promote_previous_run(snapshot: FolderSnapshot, ledger_path: str | None, resume: bool = False):
+    """
+    增量运行 (collectHistoryUrls / shardRunner) 开始时调用：上一次运行完整结束时，按删除台账确认其输出的链接
+    已被删除，把确认的指纹并入快照，其余的丢弃 (本次重新输出)；上一次运行未完整结束时丢弃其全部指纹。
+    """
+    ledger = DeleteLedger(ledger_path) if ledger_path and os.path.exists(ledger_path) else None
+    try:
+        promoted, held, discarded = snapshot.begin_run(ledger, resume)
+    finally:
+        if ledger is not None:
+            ledger.close()
+    print_begin_run(promoted, held, discarded)
+
+
+def print_begin_run(promoted: int, held: int, discarded: int):
+    if promoted or held:
+        print(f"增量快照: 并入上次运行中已确认的 {promoted} 行；{held} 个文件的删除未在台账中确认，本次将重新输出。")
+    if discarded:
+        print(f"增量快照: 上次运行未完整结束，丢弃其暂存的 {discarded} 行，未访问完的子树本次重新爬取。")
@@ -0,0 +1,197 @@
+import argparse
+import heapq
+import json
+import sqlite3
+import time
+from urllib.parse import parse_qsl, quote, urlsplit
+
+# versions.aspx 在站点地址之后的固定路径
+VERSIONS_PAGE = '/_layouts/15/versions.aspx'
+
+
+def parse_versions_link(link: str) -> tuple[str, str, int, str] | None:
+    """
+    把“版本历史记录”链接拆成 (站点前缀, 列表 GUID, 项目 ID, 相对站点的文件路径)。
+
+    只接受参数恰好为 list、ID、FileName (按此顺序) 且能由 build_versions_link 原样还原的链接；
+    其他形式返回 None，由调用方按原文存储。
+    """
+    prefix, found, query = link.partition(VERSIONS_PAGE + '?')
+    if not found:
+        return None
+    params = parse_qsl(query, keep_blank_values=True)
+    if [key for key, _ in params] != ['list', 'ID', 'FileName'] or not params[1][1].isdigit():
+        return None
+    list_guid, item_id, file_name = params[0][1], int(params[1][1]), params[2][1]
+    site_path = urlsplit(prefix).path
+    relative = file_name[len(site_path) + 1:] if file_name.startswith(site_path + '/') else None
+    if relative is None:
+        return None
+    parts = (prefix, list_guid, item_id, relative)
+    return parts if build_versions_link(*parts) == link else None
+
+
+def build_versions_link(prefix: str, list_guid: str, item_id: int, relative_path: str) -> str:
+    """parse_versions_link 的逆操作 (与 SharePoint 相同的编码：GUID 与 FileName 中的 / 都编码)。"""
+    file_name = f"{urlsplit(prefix).path}/{relative_path}"
+    return (f"{prefix}{VERSIONS_PAGE}?list={quote(list_guid, safe='')}&ID={item_id}"
+            f"&FileName={quote(file_name, safe='')}")
+
+
+# --- 紧凑的链接存储 (SQLite) ---
+class LinkStore:
+    """
+    按 (列表, 项目 ID) 紧凑地存储“版本历史记录”链接，并据此去重。
+
+    - 站点前缀 (https://租户/sites/站点) 与列表 GUID 各自只存一次 (驻留表)，每条链接只存整数 ID、
+      相对站点的文件路径以及页面显示的大小；无法拆分的链接按原文存入 raw_links。
+      两个表共用一个递增的 seq，iter_records() 按 seq 合并，保持写入顺序。
+    - 已存储链接的键保存在内存集合中，重复链接无需查询数据库即可跳过；集合由数据库中的唯一约束兜底。
+    - 不单独提交事务：由调用方 (CrawlState.complete_page) 在同一事务中写入，保证与爬取进度一致。
+    - iter_lines() 可还原为纯文本链接或 JSONL 记录，与旧版 links.txt 兼容。
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS link_prefixes (id INTEGER PRIMARY KEY, prefix TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS link_lists (id INTEGER PRIMARY KEY, guid TEXT UNIQUE);
+            CREATE TABLE IF NOT EXISTS links (
+                seq INTEGER PRIMARY KEY,
+                list_id INTEGER NOT NULL,
+                item_id INTEGER NOT NULL,
+                prefix_id INTEGER NOT NULL,
+                path TEXT NOT NULL,
+                size INTEGER,
+                version_size INTEGER,
+                UNIQUE (list_id, item_id)
+            );
+            CREATE TABLE IF NOT EXISTS raw_links (
+                seq INTEGER PRIMARY KEY, link TEXT UNIQUE, path TEXT, size INTEGER, version_size INTEGER
+            );
+        ''')
+        self._prefixes = {prefix: id_ for id_, prefix in self.conn.execute('SELECT id, prefix FROM link_prefixes')}
+        self._lists = {guid: id_ for id_, guid in self.conn.execute('SELECT id, guid FROM link_lists')}
+        self._seen: set = {list_id << 32 | item_id for list_id, item_id in
+                           self.conn.execute('SELECT list_id, item_id FROM links')}
+        self._seen.update(row[0] for row in self.conn.execute('SELECT link FROM raw_links'))
+        self._next_seq = 1 + self.conn.execute(
+            'SELECT MAX(IFNULL((SELECT MAX(seq) FROM links), 0), IFNULL((SELECT MAX(seq) FROM raw_links), 0))'
+        ).fetchone()[0]
+
+    def _intern(self, table: str, column: str, cache: dict, value: str) -> int:
+        if value not in cache:
+            cursor = self.conn.execute(f'INSERT INTO {table} ({column}) VALUES (?)', (value,))
+            cache[value] = cursor.lastrowid
+        return cache[value]
+
+    def add(self, record: dict) -> bool:
+        """
+        存储一条记录 (至少含 url，可含 path / size / version_size，见 stormanRows.to_record)。
+
+        Returns:
+            此前未存储过时返回 True；重复链接返回 False。
+        """
+        parts = parse_versions_link(record['url'])
+        if parts is None:
+            if record['url'] in self._seen:
+                return False
+            self.conn.execute('INSERT INTO raw_links (seq, link, path, size, version_size) VALUES (?, ?, ?, ?, ?)',
+                              (self._next_seq, record['url'], record.get('path'), record.get('size'),
+                               record.get('version_size')))
+            self._next_seq += 1
+            self._seen.add(record['url'])
+            return True
+
+        prefix, list_guid, item_id, relative = parts
+        list_id = self._intern('link_lists', 'guid', self._lists, list_guid)
+        key = list_id << 32 | item_id
+        if key in self._seen:
+            return False
+        prefix_id = self._intern('link_prefixes', 'prefix', self._prefixes, prefix)
+        self.conn.execute('INSERT INTO links (seq, list_id, item_id, prefix_id, path, size, version_size) '
+                          'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (self._next_seq, list_id, item_id, prefix_id, relative, record.get('size'),
+                           record.get('version_size')))
+        self._next_seq += 1
+        self._seen.add(key)
+        return True
+
+    def count(self) -> int:
+        return len(self._seen)
+
+    def iter_records(self):
+        """
+        按写入顺序逐条还原记录 {url, path, size, version_size} (两个表的游标按 seq 流式合并)。
+        旧版状态文件中两个表的 seq 各自编号，只能保证各表内部的顺序。
+        """
+        prefixes = {id_: prefix for prefix, id_ in self._prefixes.items()}
+        lists = {id_: guid for guid, id_ in self._lists.items()}
+
+        def compact():
+            for seq, list_id, item_id, prefix_id, relative, size, version_size in self.conn.execute(
+                    'SELECT seq, list_id, item_id, prefix_id, path, size, version_size FROM links ORDER BY seq'):
+                prefix = prefixes[prefix_id]
+                yield seq, {
+                    'url': build_versions_link(prefix, lists[list_id], item_id, relative),
+                    'path': f"{urlsplit(prefix).path}/{relative}",
+                    'size': size,
+                    'version_size': version_size,
+                }
+
+        def raw():
+            for seq, link, path, size, version_size in self.conn.execute(
+                    'SELECT seq, link, path, size, version_size FROM raw_links ORDER BY seq'):
+                yield seq, {'url': link, 'path': path, 'size': size, 'version_size': version_size}
+
+        for _, record in heapq.merge(compact(), raw(), key=lambda item: item[0]):
+            yield record
+
+    def iter_lines(self, output_format: str = 'txt'):
+        """导出为 links.txt 的行：txt 为纯链接，jsonl 为 JSON 记录。"""
+        for record in self.iter_records():
+            yield json.dumps(record, ensure_ascii=False) if output_format == 'jsonl' else record['url']
+
+
+# --- 批量写出输出文件 ---
+class LineBuffer:
+    """
+    缓冲待写入输出文件的行，每 max_lines 行或每 flush_interval 秒批量写入并 flush 一次，
+    取代每条链接一次 write、每个页面一次 flush。结束时必须调用 flush()。
+    """
+
+    def __init__(self, file_handle, max_lines: int = 500, flush_interval: float = 1.0):
+        self.file_handle = file_handle
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+        self._lines: list[str] = []
+        self._last_flush = time.monotonic()
+
+    def write(self, lines):
+        self._lines.extend(line + '\n' for line in lines)
+        if len(self._lines) >= self.max_lines or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._lines:
+            self.file_handle.writelines(self._lines)
+            self._lines.clear()
+        self.file_handle.flush()
+        self._last_flush = time.monotonic()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='把爬取状态文件中存储的链接导出为 links.txt / links.jsonl')
+    parser.add_argument('state', help='collectHistoryUrls 的断点状态文件 (如 crawl_state.db)')
+    parser.add_argument('output', help='导出的链接文件')
+    parser.add_argument('--format', choices=['txt', 'jsonl'], help='导出格式 (默认按输出文件扩展名判断)')
+    args = parser.parse_args()
+
+    output_format = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'txt')
+    conn = sqlite3.connect(args.state)
+    store = LinkStore(conn)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        for line in store.iter_lines(output_format):
+            file.write(line + '\n')
+    conn.close()
+    print(f"已导出 {store.count()} 个链接到 {args.output}")
@@ -0,0 +1,247 @@
+import argparse
+import asyncio
+import bisect
+import contextlib
+import json
+import time
+from collections import deque
+from datetime import datetime
+
+from stormanRows import format_size
+
+# 各阶段耗时直方图的桶上限 (秒)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# 进度摘要与 JSON 快照中每秒速率的滑动窗口 (秒)
+RATE_WINDOW = 60.0
+
+# Prometheus 指标名前缀
+METRIC_PREFIX = 'delhistory'
+
+
+class Histogram:
+    """固定桶的耗时直方图：只保存各桶计数、总和与最大值，内存占用与样本数无关。"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p: float) -> float:
+        """按桶估算的分位数 (返回所在桶的上限；落在最后一个桶时返回最大值)。"""
+        if not self.count:
+            return 0.0
+        target = p * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'avg': round(self.sum / self.count, 4) if self.count else 0.0,
+            'p50': round(self.percentile(0.5), 4),
+            'p95': round(self.percentile(0.95), 4),
+            'max': round(self.max, 4),
+        }
+
+
+# --- 进程内指标 ---
+class Metrics:
+    """
+    爬取与删除流水线的指标：计数器、仪表 (可增减的当前值)、按阶段的耗时直方图以及按阶段/异常类型的错误计数。
+
+    阶段名约定：limiter_wait (等待并发配额)、tab_wait (等待空闲标签页)、new_page、goto、wait_for_selector、
+    evaluate、delete (触发 deleteOnClick 到回发完成)、close (关闭标签页)、http_fetch、http_delete、
+    precheck (删除前读取版本页面)。
+
+    用法：
+        with METRICS.phase('goto'):
+            await page.goto(url)
+        METRICS.inc('links_deleted')
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+        self.errors: dict[tuple[str, str], int] = {}
+        self._samples: deque[tuple[float, dict[str, float]]] = deque([(self.started, {})])  # (时间, 计数器)
+
+    def inc(self, name: str, value: float = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        """设置仪表的当前值 (如并发控制器的并发上限)。"""
+        self.gauges[name] = value
+
+    def adjust(self, name: str, delta: float):
+        """调整仪表值 (如进行中的标签页数量)。"""
+        self.gauges[name] = self.gauges.get(name, 0) + delta
+
+    def observe(self, phase: str, seconds: float):
+        histogram = self.histograms.get(phase)
+        if histogram is None:
+            histogram = self.histograms[phase] = Histogram()
+        histogram.observe(seconds)
+
+    def error(self, phase: str, exc: BaseException):
+        key = (phase, type(exc).__name__)
+        self.errors[key] = self.errors.get(key, 0) + 1
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """记录代码块的耗时；代码块抛出异常时同时按异常类型计入错误。"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.error(name, e)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def rates(self, period: float = RATE_WINDOW) -> dict[str, float]:
+        """
+        各计数器最近约 period 秒内的每秒增量 (滑动窗口，与 AdaptiveLimiter.throughput 相同思路)，
+        长时间运行时也能反映吞吐的下降与恢复。每次调用记录一个采样点，由定期报告驱动。
+        """
+        now = time.monotonic()
+        self._samples.append((now, dict(self.counters)))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= period:
+            self._samples.popleft()
+        then, previous = self._samples[0]
+        elapsed = now - then
+        return {name: (value - previous.get(name, 0)) / elapsed if elapsed > 0 else 0.0
+                for name, value in self.counters.items()}
+
+    def snapshot(self) -> dict:
+        uptime = time.monotonic() - self.started
+        return {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'uptime': round(uptime, 1),
+            'counters': dict(self.counters),
+            'rates': {name: round(rate, 3) for name, rate in self.rates().items()},
+            'gauges': dict(self.gauges),
+            'phases': {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+            'errors': {f'{phase}/{cls}': count for (phase, cls), count in self.errors.items()},
+        }
+
+    def summary_text(self) -> str:
+        """
+        一行进度摘要 (供定期打印，取代各 worker 的 \\r 进度行)。括号中为最近 RATE_WINDOW 秒的速率；
+        bytes_ 开头的计数器按字节数格式化。
+        """
+        rates = self.rates()
+        parts = [f"{name} {format_size(value)} ({format_size(rates[name])}/s)" if name.startswith('bytes_')
+                 else f"{name} {value:g} ({rates[name]:.2f}/s)" for name, value in sorted(self.counters.items())]
+        parts += [f"{name} {value:g}" for name, value in sorted(self.gauges.items())]
+        parts += [f"{name} P50 {h.percentile(0.5):.2f}s P95 {h.percentile(0.95):.2f}s"
+                  for name, h in sorted(self.histograms.items())]
+        if self.errors:
+            parts.append(f"错误 {sum(self.errors.values())}")
+        return ' | '.join(parts) or '暂无数据'
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式 (0.0.4)。"""
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines += [f'# TYPE {METRIC_PREFIX}_{name}_total counter', f'{METRIC_PREFIX}_{name}_total {value:.15g}']
+        for name, value in sorted(self.gauges.items()):
+            lines += [f'# TYPE {METRIC_PREFIX}_{name} gauge', f'{METRIC_PREFIX}_{name} {value:g}']
+        if self.histograms:
+            metric = f'{METRIC_PREFIX}_phase_seconds'
+            lines.append(f'# TYPE {metric} histogram')
+            for phase, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+                lines.append(f'{metric}_count{{phase="{phase}"}} {histogram.count}')
+        if self.errors:
+            lines.append(f'# TYPE {METRIC_PREFIX}_errors_total counter')
+            for (phase, cls), count in sorted(self.errors.items()):
+                lines.append(f'{METRIC_PREFIX}_errors_total{{phase="{phase}",class="{cls}"}} {count}')
+        lines.append(f'# TYPE {METRIC_PREFIX}_uptime_seconds gauge')
+        lines.append(f'{METRIC_PREFIX}_uptime_seconds {time.monotonic() - self.started:.1f}')
+        return '\n'.join(lines) + '\n'
+
+
+def add_metrics_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='打印进度摘要 / 写入指标快照的间隔 (秒)')
+    parser.add_argument('--metrics-file', help='定期追加 JSON 指标快照 (JSONL) 的文件')
+    parser.add_argument('--metrics-port', type=int, help='在 127.0.0.1 的此端口提供 Prometheus 文本格式的指标')
+
+
+# 进程内共用的指标实例 (爬虫、删除 worker、标签页池与并发控制器都写入这里)
+METRICS = Metrics()
+
+
+async def start_prometheus_server(metrics: Metrics, port: int) -> asyncio.AbstractServer:
+    """在 127.0.0.1:port 上提供 Prometheus 文本格式的指标 (任意路径均返回指标)。"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass  # 忽略请求行与请求头
+            body = metrics.prometheus_text().encode('utf-8')
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, '127.0.0.1', port)
+
+
+def write_snapshot(metrics: Metrics, snapshot_path: str):
+    """追加一行 JSON 快照 (JSONL)，长时间运行后可按时间回看各阶段耗时的变化。"""
+    with open(snapshot_path, 'a', encoding='utf-8') as file:
+        file.write(json.dumps(metrics.snapshot(), ensure_ascii=False) + '\n')
+
+
+async def report_metrics(metrics: Metrics, interval: float, snapshot_path: str | None = None):
+    """每 interval 秒打印一行进度摘要，并在指定 snapshot_path 时追加一条 JSON 快照。"""
+    while True:
+        await asyncio.sleep(interval)
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] {metrics.summary_text()}")
+        if snapshot_path:
+            await asyncio.to_thread(write_snapshot, metrics, snapshot_path)
+
+
+@contextlib.asynccontextmanager
+async def metrics_reporting(interval: float = 10.0, snapshot_path: str | None = None,
+                            prometheus_port: int | None = None, metrics: Metrics = METRICS):
+    """
+    在代码块运行期间定期输出指标；可选地在 localhost 上提供 Prometheus 端点。
+    结束时再写一条最终快照。
+    """
+    server = None
+    if prometheus_port:
+        server = await start_prometheus_server(metrics, prometheus_port)
+        print(f"Prometheus 指标: http://127.0.0.1:{prometheus_port}/metrics")
+    reporter = asyncio.create_task(report_metrics(metrics, interval, snapshot_path))
+    try:
+        yield metrics
+    finally:
+        reporter.cancel()
+        await asyncio.gather(reporter, return_exceptions=True)
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+        if snapshot_path:
+            write_snapshot(metrics, snapshot_path)
+        print(f"指标汇总: {metrics.summary_text()}")
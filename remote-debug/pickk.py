@@ -1,35 +1,169 @@
-from urllib.parse import unquote
-
-# 打开并读取文件
-filenam = 'links.txt'
-with open(filenam, 'r', encoding='utf-8') as file:
-    lines = file.readlines()
-
-# 定义需要过滤的扩展名列表（包含大小写）
-extensions_to_filter = {
-    'nfo', 'NFO', 'jpg', 'JPG', 'png', 'PNG', 'sh', 'SH',
-    'json', 'JSON', 'ini', 'INI', 'js', 'JS', 'ass', 'ASS',
-    'srt', 'SRT', 'ssa', 'SSA', 'ttf', 'TTF', 'sfv', 'SFV',
-    'sup', 'SUP', 'svg', 'SVG', 'doc', 'DOC', 'webvtt', 'WEBVTT',
-    'md', 'MD', 'Atmos','xml'
-}
-
-# 过滤掉以指定扩展名结尾的行（支持大小写）
-filtered_lines = [
-    line for line in lines
-    if not unquote(line.strip()).split('.')[-1] in extensions_to_filter
-]
-
-
-# 将过滤后的行写回原文件
-with open(filenam, 'w', encoding='utf-8') as file:
-    file.writelines(filtered_lines)
-
-print("处理完成，原文件已更新")
-# 提取每行的后四位字符，并去重
-last_four_chars = set(line.strip()[-4:] for line in lines if len(line.strip()) >= 4)
-
-# 打印去重后的结果
-print("文件中所有行的后四位字符（去重后）：")
-for chars in last_four_chars:
-    print(chars)
\ No newline at end of file
+import argparse
+import json
+import os
+import re
+import tempfile
+from urllib.parse import unquote, urlsplit, parse_qs
+
+# 默认需要过滤的扩展名 (统一小写，匹配时不区分大小写)
+DEFAULT_EXCLUDED_EXTENSIONS = (
+    'nfo', 'jpg', 'png', 'sh', 'json', 'ini', 'js', 'ass', 'srt', 'ssa', 'ttf', 'sfv',
+    'sup', 'svg', 'doc', 'webvtt', 'md', 'atmos', 'xml',
+)
+
+# 每次读取的字节数 (按行切分)
+CHUNK_SIZE = 1024 * 1024
+
+
+def link_path(link: str) -> str:
+    """
+    链接对应的文件路径 (已解码)。
+
+    JSONL 记录取其 path 字段；versions.aspx 链接优先取 FileName 参数，否则退回到解码后的整条链接。
+    """
+    link = link.strip()
+    if link.startswith('{'):
+        record = json.loads(link)
+        return record.get('path') or link_path(record['url'])
+    query = parse_qs(urlsplit(link).query)
+    for key in ('FileName', 'filename', 'fileName'):
+        if key in query:
+            return query[key][0]
+    return unquote(link)
+
+
+def path_extension(path: str) -> str:
+    """文件路径的扩展名 (小写，不含点)；没有扩展名时返回空字符串。"""
+    name = path.rsplit('/', 1)[-1]
+    return name.rsplit('.', 1)[-1].lower() if '.' in name else ''
+
+
+# --- 链接过滤规则 ---
+class LinkFilter:
+    """
+    预编译的链接过滤规则，可被 collectHistoryUrls / delHistory / collectAndDelete 直接导入使用。
+
+    规则按扩展名、路径前缀、正则三类，每类都可设置 include (白名单，非空时只保留匹配项)
+    与 exclude (黑名单)。扩展名和路径前缀均不区分大小写；正则匹配文件路径。
+    """
+
+    def __init__(self, exclude_extensions=DEFAULT_EXCLUDED_EXTENSIONS, include_extensions=(),
+                 exclude_prefixes=(), include_prefixes=(), exclude_patterns=(), include_patterns=()):
+        self.exclude_extensions = frozenset(ext.lower().lstrip('.') for ext in exclude_extensions)
+        self.include_extensions = frozenset(ext.lower().lstrip('.') for ext in include_extensions)
+        self.exclude_prefixes = tuple(prefix.casefold() for prefix in exclude_prefixes)
+        self.include_prefixes = tuple(prefix.casefold() for prefix in include_prefixes)
+        self.exclude_regex = re.compile('|'.join(f'(?:{p})' for p in exclude_patterns)) if exclude_patterns else None
+        self.include_regex = re.compile('|'.join(f'(?:{p})' for p in include_patterns)) if include_patterns else None
+
+    def classify(self, link: str) -> tuple[str, bool]:
+        """返回 (扩展名, 是否保留)，只解析一次链接。"""
+        path = link_path(link)
+        extension = path_extension(path)
+        return extension, self._keep_path(path, extension)
+
+    def should_keep(self, link: str) -> bool:
+        return self.classify(link)[1]
+
+    def should_keep_path(self, path: str) -> bool:
+        """直接按文件路径判断 (供爬虫在只知道文件夹路径和文件名时使用)。"""
+        return self._keep_path(path, path_extension(path))
+
+    def _keep_path(self, path: str, extension: str) -> bool:
+        if extension in self.exclude_extensions:
+            return False
+        if self.include_extensions and extension not in self.include_extensions:
+            return False
+        if self.exclude_prefixes or self.include_prefixes:
+            folded = path.casefold()
+            if self.exclude_prefixes and folded.startswith(self.exclude_prefixes):
+                return False
+            if self.include_prefixes and not folded.startswith(self.include_prefixes):
+                return False
+        if self.exclude_regex is not None and self.exclude_regex.search(path):
+            return False
+        if self.include_regex is not None and not self.include_regex.search(path):
+            return False
+        return True
+
+
+DEFAULT_FILTER = LinkFilter()
+
+
+def should_keep(line: str) -> bool:
+    """按默认规则判断链接是否保留。"""
+    return DEFAULT_FILTER.should_keep(line)
+
+
+def filter_file(src: str, dst: str | None = None, link_filter: LinkFilter = DEFAULT_FILTER):
+    """
+    单遍流式过滤链接文件，同时统计扩展名分布。
+
+    先写入同目录下的临时文件，完成后用 os.replace 原子替换 dst (默认覆盖 src)，
+    中途崩溃不会留下写了一半的链接文件。
+
+    Returns:
+        (kept, removed, histogram)，histogram 为 {扩展名: [总数, 过滤数]}。
+    """
+    dst = dst or src
+    kept = removed = 0
+    histogram: dict[str, list[int]] = {}
+    fd, tmp_path = tempfile.mkstemp(prefix='.pickk-', dir=os.path.dirname(os.path.abspath(dst)))
+    try:
+        with open(src, 'r', encoding='utf-8') as reader, os.fdopen(fd, 'w', encoding='utf-8') as writer:
+            while lines := reader.readlines(CHUNK_SIZE):
+                output = []
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    extension, keep = link_filter.classify(line)
+                    counts = histogram.setdefault(extension, [0, 0])
+                    counts[0] += 1
+                    if keep:
+                        output.append(line if line.endswith('\n') else line + '\n')
+                    else:
+                        counts[1] += 1
+                        removed += 1
+                kept += len(output)
+                writer.writelines(output)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return kept, removed, histogram
+
+
+def split_values(values) -> list[str]:
+    """把多次出现、逗号分隔的命令行参数展开为列表。"""
+    return [item.strip() for value in values or () for item in value.split(',') if item.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='按扩展名 / 路径前缀 / 正则过滤链接文件 (默认原地更新 links.txt)')
+    parser.add_argument('file', nargs='?', default='links.txt', help='链接文件')
+    parser.add_argument('--output', help='输出文件 (默认覆盖输入文件)')
+    parser.add_argument('--exclude-ext', action='append', help='额外过滤的扩展名，逗号分隔')
+    parser.add_argument('--no-default-excludes', action='store_true', help='不使用默认的扩展名过滤列表')
+    parser.add_argument('--include-ext', action='append', help='只保留这些扩展名，逗号分隔')
+    parser.add_argument('--exclude-prefix', action='append', help='过滤以此路径开头的文件，如 /sites/x/Shared Documents/字幕')
+    parser.add_argument('--include-prefix', action='append', help='只保留以此路径开头的文件')
+    parser.add_argument('--exclude-regex', action='append', help='过滤路径匹配此正则的文件')
+    parser.add_argument('--include-regex', action='append', help='只保留路径匹配此正则的文件')
+    args = parser.parse_args()
+
+    excluded = () if args.no_default_excludes else DEFAULT_EXCLUDED_EXTENSIONS
+    rules = LinkFilter(
+        exclude_extensions=(*excluded, *split_values(args.exclude_ext)),
+        include_extensions=split_values(args.include_ext),
+        exclude_prefixes=args.exclude_prefix or (),
+        include_prefixes=args.include_prefix or (),
+        exclude_patterns=args.exclude_regex or (),
+        include_patterns=args.include_regex or (),
+    )
+    kept, removed, histogram = filter_file(args.file, args.output, rules)
+
+    print(f"处理完成，保留 {kept} 条，过滤 {removed} 条，已写入 {args.output or args.file}")
+    print("扩展名分布 (总数 / 过滤数)：")
+    for extension, (total, dropped) in sorted(histogram.items(), key=lambda item: -item[1][0]):
+        print(f"{extension or '(无扩展名)':>12}  {total:>8} / {dropped}")
@@ -0,0 +1,61 @@
+import argparse
+import random
+
+
+# --- 各阶段超时与重试策略 ---
+class RetryPolicy:
+    """
+    按阶段设置的超时 (秒) 与有界重试策略，取代原来统一的 120 秒 / 60 秒超时。
+
+    - goto_timeout: 打开页面 (page.goto) 的超时。
+    - selector_timeout: 等待 storman.aspx 表格出现 (wait_for_selector) 的超时。
+    - http_timeout: HTTP 模式下单个请求 (含读取响应) 的超时。
+    - delete_timeout: playwright 删除后端等待删除回发完成的超时。
+    - max_attempts: 单个页面的最大尝试次数 (含第一次)；用尽后记为失败，不再静默丢弃。
+    - max_throttle_attempts: 单个页面或链接被限流 (429/503) 的最大次数，单独计数且上限更大
+      (限流时由 AdaptiveLimiter 暂停所有 worker)；用尽后同样记为失败，避免持续限流的页面让爬取永不结束。
+    - 第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 之间的随机时间 (full jitter)，
+      避免大量失败页面在同一时刻重试。
+    """
+
+    def __init__(self, goto_timeout: float = 30.0, selector_timeout: float = 15.0, http_timeout: float = 30.0,
+                 max_attempts: int = 3, base_delay: float = 2.0, max_delay: float = 60.0,
+                 max_throttle_attempts: int = 10, delete_timeout: float = 30.0):
+        self.goto_timeout = goto_timeout
+        self.selector_timeout = selector_timeout
+        self.http_timeout = http_timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_throttle_attempts = max_throttle_attempts
+        self.delete_timeout = delete_timeout
+
+    def retry_delay(self, attempt: int) -> float:
+        """第 attempt 次失败 (从 1 开始) 之后、重试之前的等待秒数。"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+def add_retry_arguments(parser: argparse.ArgumentParser, crawl: bool = True, delete: bool = False):
+    """
+    crawl=False 时 (delHistory) 不添加爬取页面的参数，删除的重试次数由其 --max-attempts 控制；
+    delete=True 时 (delHistory / collectAndDelete) 添加删除回发的超时。
+    """
+    parser.add_argument('--goto-timeout', type=float, default=30.0, help='打开页面的超时时间 (秒)')
+    parser.add_argument('--http-timeout', type=float, default=30.0, help='HTTP 模式下单个请求的超时时间 (秒)')
+    if delete:
+        parser.add_argument('--delete-timeout', type=float, default=30.0,
+                            help='等待删除回发完成的超时时间 (秒)，取代原来固定的 3 秒等待')
+    parser.add_argument('--throttle-attempts', type=int, default=10,
+                        help='单个页面或链接被限流 (429/503) 的最大次数，用尽后记为失败')
+    if crawl:
+        parser.add_argument('--selector-timeout', type=float, default=15.0, help='等待页面表格出现的超时时间 (秒)')
+        parser.add_argument('--page-attempts', type=int, default=3,
+                            help='单个页面的最大尝试次数 (失败后随机退避重新入队，用尽后记为失败)')
+
+
+def build_retry_policy(args: argparse.Namespace) -> RetryPolicy:
+    defaults = RetryPolicy()
+    return RetryPolicy(args.goto_timeout, getattr(args, 'selector_timeout', defaults.selector_timeout),
+                       args.http_timeout, getattr(args, 'page_attempts', defaults.max_attempts),
+                       max_throttle_attempts=getattr(args, 'throttle_attempts', defaults.max_throttle_attempts),
+                       delete_timeout=getattr(args, 'delete_timeout', defaults.delete_timeout))
@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import hashlib
+import os
+import time
+from playwright.async_api import async_playwright
+
+from adaptiveLimiter import AdaptiveLimiter
+from browserSession import add_browser_arguments, get_async_browser_session, PagePool, ResourceStats, select_browser
+from collectHistoryUrls import add_pruner_arguments, build_pruner, get_feature_links
+from crawlState import DONE_MARKER_SUFFIX, CrawlState
+from folderSnapshot import FolderSnapshot, promote_previous_run
+from metrics import add_metrics_arguments, metrics_reporting
+from retryPolicy import add_retry_arguments, build_retry_policy
+
+try:
+    from sharepointHttp import create_http_session
+except ImportError:  # aiohttp 未安装时仅浏览器模式可用
+    create_http_session = None
+
+
+def read_manifest(path: str) -> list[str]:
+    """读取清单文件：每行一个起始 storman.aspx 地址，忽略空行与 # 开头的注释，重复地址只保留一次。"""
+    urls = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in urls:
+                urls.append(line)
+    return urls
+
+
+def site_state_path(state_dir: str, url: str) -> str:
+    """每个起始地址一个断点状态文件，文件名取地址的哈希。"""
+    return os.path.join(state_dir, hashlib.sha1(url.encode('utf-8')).hexdigest()[:16] + '.db')
+
+
+def site_snapshot_path(state_dir: str, url: str) -> str:
+    """每个起始地址一个增量扫描快照文件，与断点状态文件放在一起。"""
+    return site_state_path(state_dir, url)[:-len('.db')] + '.snapshot.db'
+
+
+def split_evenly(total: int, parts: int) -> list[int]:
+    """把 total 尽量平均地分成 parts 份 (每份至少 1)，用于分配全局标签页上限。"""
+    return [max(1, total // parts + (1 if i < total % parts else 0)) for i in range(parts)]
+
+
+# --- 合并进度 ---
+class ShardProgress:
+    """汇总所有浏览器实例的进度：已完成站点数、写出的链接数以及每个实例当前处理的站点。"""
+
+    def __init__(self, total_sites: int):
+        self.total_sites = total_sites
+        self.done_sites = 0
+        self.failed_sites = 0
+        self.failed_pages = 0
+        self.links = 0
+        self.current: dict[int, str] = {}
+        self.started = time.monotonic()
+
+    def status_text(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return (f"站点 {self.done_sites}/{self.total_sites} (失败 {self.failed_sites}，未能爬取的页面 {self.failed_pages})，"
+                f"链接 {self.links} ({self.links / elapsed if elapsed else 0:.1f}/s)，"
+                f"运行中的实例 {len(self.current)}")
+
+
+# --- 单个浏览器实例: 依次从共享队列中领取站点并爬取 ---
+async def run_shard(shard_id: int, playwright, sites: asyncio.Queue, debug_port: int, user_data_dir: str | None,
+                    tabs: int, limiter: AdaptiveLimiter, file_handle, lock: asyncio.Lock, state_dir: str,
+                    resume: bool, use_http: bool, pruner, output_format: str, progress: ShardProgress,
+                    storage_state: str | None = None, full_profile_copy: bool = False, lean: bool = False,
+                    retry_policy=None, incremental: bool = False, ledger_path: str | None = None):
+    """
+    启动 (或连接) 一个独立端口、独立用户数据目录的浏览器实例，并不断领取清单中的下一个站点，
+    直到队列为空。所有实例共用同一个 AdaptiveLimiter 与输出文件，因此并发上限和输出都是全局的。
+    incremental=True 时每个站点使用各自的 FolderSnapshot，只重新访问有变化的文件夹；
+    ledger_path 为确认上次输出的链接已删除所用的删除台账。
+    """
+    async with get_async_browser_session(playwright, debug_port, user_data_dir, storage_state,
+                                         full_profile_copy, headless=lean) as browser_context:
+        page_pool = PagePool(browser_context, tabs)
+        resource_stats = await ResourceStats.attach(browser_context) if lean else None
+        http_session = None
+        if use_http:
+            http_session = await create_http_session(browser_context, tabs)
+        try:
+            while True:
+                try:
+                    url = sites.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                progress.current[shard_id] = url
+                state_path = site_state_path(state_dir, url)
+                state = CrawlState(state_path) if resume and os.path.exists(state_path) else CrawlState.fresh(state_path)
+                snapshot = None
+                if incremental:
+                    snapshot = FolderSnapshot(site_snapshot_path(state_dir, url))
+                    promote_previous_run(snapshot, ledger_path, resume)
+                try:
+                    print(f"[shard-{shard_id}] 开始爬取: {url}")
+                    found = await get_feature_links(url, page_pool, file_handle, lock, tabs, state, http_session,
+                                                    limiter, pruner=pruner, output_format=output_format,
+                                                    policy=retry_policy, snapshot=snapshot)
+                    progress.links += found
+                    progress.done_sites += 1
+                    failed_pages = len(state.load_failed())
+                    progress.failed_pages += failed_pages
+                    if snapshot is not None:
+                        print(f"[shard-{shard_id}] {snapshot.summary_text()}")
+                        if failed_pages:
+                            snapshot.reset_pending()  # 有失败页面时本次指纹不并入快照
+                        else:
+                            snapshot.mark_complete()
+                    print(f"[shard-{shard_id}] 完成: {url}，新写入 {found} 个链接。{progress.status_text()}")
+                except Exception as e:
+                    progress.failed_sites += 1
+                    print(f"[shard-{shard_id}] 爬取 {url} 失败: {e} (可使用 --resume 从断点继续)")
+                finally:
+                    state.close()
+                    if snapshot is not None:
+                        snapshot.close()
+                    progress.current.pop(shard_id, None)
+        finally:
+            await page_pool.close()
+            if http_session is not None:
+                await http_session.close()
+            if resource_stats is not None:
+                await resource_stats.detach()
+                print(f"[shard-{shard_id}] {resource_stats.summary_text(page_pool)}")
+
+
+async def report_progress(progress: ShardProgress, limiter: AdaptiveLimiter, interval: float):
+    """定期打印合并后的进度。"""
+    while True:
+        await asyncio.sleep(interval)
+        print(f"\n[进度] {progress.status_text()}，{limiter.status_text()}")
+
+
+# --- 主函数 ---
+async def main(manifest_path, output_filename='links.txt', state_dir='shard_state', browsers=2, base_port=9300,
+               profile_dir=None, concurrency_limit=30, max_tabs=30, initial_concurrency=4, resume=False,
+               use_http=False, pruner=None, output_format='txt', report_interval=30.0, storage_state=None,
+               full_profile_copy=False, lean=False, metrics_interval=10.0, metrics_file=None, metrics_port=None,
+               retry_policy=None, incremental=False, ledger_path='delete_ledger.db'):
+    """
+    按清单把多个站点 / 文档库分配给 browsers 个浏览器实例并行爬取，输出合并到同一个链接文件。
+
+    - 第 i 个实例使用调试端口 base_port + i 和独立的用户数据目录 (profile_dir/shard-i)。
+    - concurrency_limit 为所有实例合计的并发上限 (共用一个 AdaptiveLimiter)；
+      max_tabs 为所有实例合计的标签页上限，平均分配到各实例的标签页池。
+    - 每个站点有自己的断点状态文件，--resume 时已完成的站点直接跳过，未完成的从断点继续。
+    - incremental=True 时每个站点与其上次完整爬取的快照比较，只输出新增或有变化的文件。
+    """
+    urls = read_manifest(manifest_path)
+    if not urls:
+        print(f"清单 {manifest_path} 中没有起始地址。")
+        return
+    if use_http and create_http_session is None:
+        print("HTTP 快速模式需要 aiohttp，请先执行: pip install aiohttp")
+        return
+
+    browsers = max(1, min(browsers, len(urls), max_tabs))
+    tabs_per_browser = split_evenly(max_tabs, browsers)
+    if profile_dir is None:
+        profile_dir = os.path.join(os.path.dirname(select_browser()[3]), 'ShardProfiles')
+    os.makedirs(state_dir, exist_ok=True)
+
+    done_marker = output_filename + DONE_MARKER_SUFFIX
+    if os.path.exists(done_marker):
+        os.remove(done_marker)
+
+    sites: asyncio.Queue[str] = asyncio.Queue()
+    for url in urls:
+        sites.put_nowait(url)
+    limiter = AdaptiveLimiter(min(initial_concurrency * browsers, concurrency_limit), 1, concurrency_limit)
+    progress = ShardProgress(len(urls))
+    print(f"共 {len(urls)} 个站点，{browsers} 个浏览器实例 (端口 {base_port}-{base_port + browsers - 1})，"
+          f"全局并发上限 {concurrency_limit}，标签页分配 {tabs_per_browser}")
+
+    with open(output_filename, 'w', encoding='utf-8') as file:
+        # 续爬时以各站点的断点库为准重写已输出的链接
+        if resume:
+            for url in urls:
+                state_path = site_state_path(state_dir, url)
+                if os.path.exists(state_path):
+                    state = CrawlState(state_path)
+                    for line in state.iter_emitted(output_format):
+                        file.write(line + '\n')
+                    state.close()
+        file.flush()
+        print(f"将实时写入链接到 {output_filename}...")
+
+        lock = asyncio.Lock()
+        reporter = asyncio.create_task(report_progress(progress, limiter, report_interval))
+        try:
+            async with async_playwright() as p, metrics_reporting(metrics_interval, metrics_file, metrics_port):
+                shards = [
+                    run_shard(i, p, sites, base_port + i, os.path.join(profile_dir, f'shard-{i}'),
+                              tabs_per_browser[i], limiter, file, lock, state_dir, resume, use_http, pruner,
+                              output_format, progress, storage_state, full_profile_copy, lean, retry_policy,
+                              incremental, ledger_path)
+                    for i in range(browsers)
+                ]
+                results = await asyncio.gather(*shards, return_exceptions=True)
+                for i, result in enumerate(results):
+                    if isinstance(result, Exception):
+                        print(f"[shard-{i}] 浏览器实例异常退出: {result}")
+        finally:
+            reporter.cancel()
+
+    print(f"\n全部完成。{progress.status_text()}")
+    print(f"最终 {limiter.status_text()}")
+    if pruner is not None:
+        print(f"剪枝: 跳过 {pruner.pruned_folders} 个文件夹，{pruner.pruned_files} 个文件。")
+    if sites.empty() and not progress.failed_sites and not progress.failed_pages:
+        with open(done_marker, 'w', encoding='utf-8'):
+            pass
+    else:
+        print("部分站点未完成，可使用 --resume 继续。")
+
+
+# --- 启动器 ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='按清单在多个浏览器实例上并行收集多个站点 / 文档库的“版本历史记录”链接')
+    parser.add_argument('manifest', help='清单文件: 每行一个起始 storman.aspx 地址，# 开头为注释')
+    parser.add_argument('--output', default='links.txt', help='合并输出的链接文件')
+    parser.add_argument('--format', choices=['txt', 'jsonl'], help='输出格式 (同 collectHistoryUrls，默认按扩展名判断)')
+    parser.add_argument('--state-dir', default='shard_state', help='各站点断点状态文件所在目录')
+    parser.add_argument('--resume', action='store_true', help='跳过已完成的站点，未完成的从断点继续')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量扫描: 各站点与上次完整爬取的快照 (保存在 --state-dir) 比较，跳过未变化的子文件夹')
+    parser.add_argument('--ledger', default='delete_ledger.db',
+                        help='delHistory 的删除台账: 增量扫描只把台账中已确认删除的文件并入快照')
+    parser.add_argument('--browsers', type=int, default=2, help='浏览器实例数量')
+    parser.add_argument('--base-port', type=int, default=9300, help='第一个实例的调试端口，之后依次加 1')
+    parser.add_argument('--profile-dir', help='各实例用户数据目录的父目录 (默认在浏览器数据目录旁的 ShardProfiles)')
+    parser.add_argument('--concurrency', type=int, default=30, help='所有实例合计的最大并发数量')
+    parser.add_argument('--max-tabs', type=int, default=30, help='所有实例合计的标签页上限')
+    parser.add_argument('--initial-concurrency', type=int, default=4, help='每个实例的初始并发数量 (随后自适应调整)')
+    parser.add_argument('--http', action='store_true', help='HTTP 快速模式: 复用浏览器 Cookie 直接请求页面 (需要 aiohttp)')
+    add_browser_arguments(parser)
+    add_pruner_arguments(parser)
+    add_retry_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    pruner = build_pruner(args, parser)
+
+    output_format = args.format or ('jsonl' if args.output.endswith('.jsonl') else 'txt')
+    asyncio.run(main(args.manifest, args.output, args.state_dir, args.browsers, args.base_port, args.profile_dir,
+                     args.concurrency, args.max_tabs, args.initial_concurrency, args.resume, args.http, pruner,
+                     output_format, 30.0, args.storage_state, args.full_profile_copy,
+                     args.lean, args.metrics_interval, args.metrics_file, args.metrics_port,
+                     build_retry_policy(args), args.incremental, args.ledger))
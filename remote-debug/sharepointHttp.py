@@ -0,0 +1,329 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from http.cookies import SimpleCookie
+from urllib.parse import urljoin
+
+import aiohttp
+from playwright.async_api import BrowserContext
+from yarl import URL
+
+from adaptiveLimiter import check_throttled
+from stormanRows import FEATURE_LINK_TEXT, make_row, parse_size
+
+# 每次从响应流中读取的字节数
+CHUNK_SIZE = 64 * 1024
+
+
+# --- HTTP 会话: 复用浏览器 Context 的登录 Cookie ---
+async def create_http_session(browser_context: BrowserContext, pool_size: int = 15) -> aiohttp.ClientSession:
+    """
+    使用浏览器 Context 中的 Cookie 创建一个带连接池 (keep-alive) 的 aiohttp 会话。
+
+    调用方负责在结束时 await session.close()。
+    """
+    jar = aiohttp.CookieJar()
+    for cookie in await browser_context.cookies():
+        morsel = SimpleCookie()
+        morsel[cookie['name']] = cookie['value']
+        morsel[cookie['name']]['domain'] = cookie['domain']
+        morsel[cookie['name']]['path'] = cookie.get('path', '/')
+        host = cookie['domain'].lstrip('.')
+        jar.update_cookies(morsel, response_url=URL(f"https://{host}/"))
+
+    connector = aiohttp.TCPConnector(limit=pool_size, keepalive_timeout=60)
+    # 沿用浏览器的 User-Agent，避免 SharePoint 返回不同版本的页面
+    headers = None
+    if browser_context.pages:
+        try:
+            headers = {'User-Agent': await browser_context.pages[0].evaluate('() => navigator.userAgent')}
+        except Exception:
+            pass
+    return aiohttp.ClientSession(cookie_jar=jar, connector=connector, headers=headers,
+                                 timeout=aiohttp.ClientTimeout(total=120))
+
+
+# --- storman.aspx 流式解析器 ---
+class StormanPageParser(HTMLParser):
+    """
+    流式解析 storman.aspx 的 HTML，提取与 scrape_storman_page 相同的内容：
+    1. 子文件夹行: 第 2 个单元格中的第一个 <a> 指向 /storman.aspx?root= 的行。
+    2. “版本历史记录”行: 含文本恰好为“版本历史记录”的 <a> 的行 (每个链接一条记录)。
+    3. “下一个”分页链接: 文本包含“下一个”的第一个 <a>。
+    行记录由 stormanRows.make_row 生成。
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.folder_rows: list[dict] = []
+        self.feature_rows: list[dict] = []
+        self.next_page_link: str | None = None
+        # 打开中的 <tr> (支持嵌套表格)：{'cells': [...], 'second_cell_link': bool, 'folder': url, 'features': [...]}
+        self._rows: list[dict] = []
+        self._anchor_href: str | None = None
+        self._anchor_text: list[str] | None = None
+        self._anchor_in_second_cell = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr':
+            self._rows.append({'cells': [], 'second_cell_link': False, 'folder': None, 'features': []})
+        elif tag == 'td' and self._rows:
+            self._rows[-1]['cells'].append('')
+        elif tag == 'a':
+            href = dict(attrs).get('href')
+            self._anchor_href = urljoin(self.base_url, href) if href else None
+            self._anchor_text = []
+            self._anchor_in_second_cell = bool(self._rows) and len(self._rows[-1]['cells']) == 2
+
+    def handle_endtag(self, tag):
+        if tag == 'tr' and self._rows:
+            self._finish_row(self._rows.pop())
+        elif tag == 'a' and self._anchor_text is not None:
+            text = ''.join(self._anchor_text)
+            href = self._anchor_href
+            row = self._rows[-1] if self._rows else None
+            if href:
+                # 与 row.querySelector('td:nth-child(2) a') 一致：每行只取第一个
+                if self._anchor_in_second_cell and row is not None and not row['second_cell_link']:
+                    row['second_cell_link'] = True
+                    if '/storman.aspx?root=' in href:
+                        row['folder'] = href
+                if text == FEATURE_LINK_TEXT:
+                    if row is not None:
+                        row['features'].append(href)
+                    else:
+                        self.feature_rows.append(make_row(href, []))
+                if self.next_page_link is None and '下一个' in text:
+                    self.next_page_link = href
+            self._anchor_href = None
+            self._anchor_text = None
+
+    def handle_data(self, data):
+        if self._anchor_text is not None:
+            self._anchor_text.append(data)
+        if self._rows and self._rows[-1]['cells']:
+            self._rows[-1]['cells'][-1] += data
+
+    def _finish_row(self, row: dict):
+        if row['folder']:
+            self.folder_rows.append(make_row(row['folder'], row['cells']))
+        for href in row['features']:
+            self.feature_rows.append(make_row(href, row['cells']))
+
+    def close(self):
+        super().close()
+        while self._rows:
+            self._finish_row(self._rows.pop())
+
+
+def request_timeout(seconds: float | None) -> dict:
+    """单个请求的超时参数 (覆盖会话级的 120 秒)；seconds 为 None 时沿用会话设置。"""
+    return {'timeout': aiohttp.ClientTimeout(total=seconds)} if seconds else {}
+
+
+async def fetch_storman_page(session: aiohttp.ClientSession, url: str,
+                             timeout: float | None = None) -> tuple[list[dict], list[dict], str | None]:
+    """
+    不打开标签页，直接通过 HTTP 获取 storman.aspx 并流式解析。timeout 为整个请求的超时 (秒)。
+
+    Returns:
+        (folder_rows, feature_rows, next_page_link)，与 scrape_storman_page 相同。
+    """
+    async with session.get(url, **request_timeout(timeout)) as response:
+        check_throttled(response.status, response.headers)
+        response.raise_for_status()
+        if 'login.microsoftonline.com' in str(response.url):
+            raise RuntimeError("Cookie 已失效，请求被重定向到登录页。请在浏览器中重新登录。")
+        parser = StormanPageParser(str(response.url))
+        decoder = codecs.getincrementaldecoder(response.charset or 'utf-8')(errors='replace')
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b'', final=True))
+        parser.close()
+    return parser.folder_rows, parser.feature_rows, parser.next_page_link
+
+
+# --- versions.aspx: 直接提交“删除所有版本”回发 ---
+class VersionsFormParser(HTMLParser):
+    """
+    解析 versions.aspx，收集主表单的 action、全部 <input> 字段 (含 __VIEWSTATE、
+    __EVENTVALIDATION、__REQUESTDIGEST 等) 以及内联脚本文本 (用于分析 deleteOnClick)。
+    """
+
+    def __init__(self, base_url: str):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.form_action: str | None = None
+        self.fields: dict[str, str] = {}
+        self.scripts: list[str] = []
+        self._in_form = False
+        self._in_script = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form' and self.form_action is None:
+            self._in_form = True
+            self.form_action = urljoin(self.base_url, attrs.get('action') or self.base_url)
+        elif tag == 'input' and self._in_form and attrs.get('name'):
+            input_type = (attrs.get('type') or 'text').lower()
+            if input_type in ('submit', 'button', 'image', 'reset'):
+                return
+            if input_type in ('checkbox', 'radio') and 'checked' not in attrs:
+                return
+            self.fields[attrs['name']] = attrs.get('value') or ''
+        elif tag == 'script':
+            self._in_script = True
+            self.scripts.append('')
+
+    def handle_endtag(self, tag):
+        if tag == 'form':
+            self._in_form = False
+        elif tag == 'script':
+            self._in_script = False
+
+    def handle_data(self, data):
+        if self._in_script:
+            self.scripts[-1] += data
+
+
+class VersionHistoryParser(HTMLParser):
+    """
+    统计 versions.aspx 中可删除的历史版本：链接指向 /_vti_history/ 的行即一个历史版本 (当前版本链接到文件本身)，
+    行中第一个大小文本计入历史版本合计大小。
+
+    只有识别到版本列表 (ms-settingsframe 表格或至少一个历史版本行) 时，“0 个历史版本”才可信；
+    错误页、拒绝访问页或结构变化的页面 recognised 为 False，由 summary() 抛出异常。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.history_versions = 0
+        self.history_bytes = 0
+        self.recognised = False
+        self._rows: list[dict] = []  # 打开中的 <tr> (支持嵌套表格)：{'cells': [...], 'history': bool}
+
+    def summary(self) -> tuple[int, int]:
+        """(历史版本数量, 历史版本合计字节数)；未识别到版本列表时抛出 RuntimeError。"""
+        if not self.recognised:
+            raise RuntimeError("未能在页面中识别版本列表 (可能是错误页、无权限或页面结构已变化)。")
+        return self.history_versions, self.history_bytes
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table' and 'ms-settingsframe' in (dict(attrs).get('class') or '').split():
+            self.recognised = True
+        elif tag == 'tr':
+            self._rows.append({'cells': [], 'history': False})
+        elif tag == 'td' and self._rows:
+            self._rows[-1]['cells'].append('')
+        elif tag == 'a' and self._rows and '/_vti_history/' in (dict(attrs).get('href') or ''):
+            self._rows[-1]['history'] = True
+
+    def handle_endtag(self, tag):
+        if tag == 'tr' and self._rows:
+            row = self._rows.pop()
+            if row['history']:
+                self.recognised = True
+                self.history_versions += 1
+                sizes = [size for size in map(parse_size, row['cells']) if size is not None]
+                self.history_bytes += sizes[0] if sizes else 0
+
+    def handle_data(self, data):
+        if self._rows and self._rows[-1]['cells']:
+            self._rows[-1]['cells'][-1] += data
+
+
+async def fetch_version_summary(session: aiohttp.ClientSession, url: str,
+                                timeout: float | None = None) -> tuple[int, int]:
+    """
+    只读取 versions.aspx (不打开标签页、不提交回发)，用于删除前的预检查与 --dry-run。
+
+    Returns:
+        (历史版本数量, 历史版本合计字节数)；只有当前版本时为 (0, 0)。未识别到版本列表时抛出异常。
+    """
+    async with session.get(url, **request_timeout(timeout)) as response:
+        check_throttled(response.status, response.headers)
+        response.raise_for_status()
+        if 'login.microsoftonline.com' in str(response.url):
+            raise RuntimeError("Cookie 已失效，请求被重定向到登录页。请在浏览器中重新登录。")
+        parser = VersionHistoryParser()
+        parser.feed(await response.text())
+        parser.close()
+    return parser.summary()
+
+
+def build_delete_all_postback(parser: VersionsFormParser) -> dict[str, str]:
+    """
+    根据页面中的 deleteOnClick() 源码，构造与其相同的回发表单字段。
+
+    支持两种写法：给表单字段赋值 (form.xxx.value = "...") 以及 __doPostBack('target', 'arg')。
+    """
+    source = '\n'.join(parser.scripts)
+    match = re.search(r'function\s+deleteOnClick\s*\([^)]*\)\s*\{', source)
+    if not match:
+        raise RuntimeError("页面中未找到 deleteOnClick()，可能没有可删除的历史版本或页面结构已变化。")
+    # 截取函数体 (按花括号配对)
+    depth, end = 0, match.end() - 1
+    for end in range(match.end() - 1, len(source)):
+        if source[end] == '{':
+            depth += 1
+        elif source[end] == '}':
+            depth -= 1
+            if depth == 0:
+                break
+    body = source[match.end():end]
+
+    data = dict(parser.fields)
+    assignments = re.findall(r'''\.\s*(\w+)\s*\.\s*value\s*=\s*["']([^"']*)["']''', body)
+    postback = re.search(r'''__doPostBack\s*\(\s*["']([^"']*)["']\s*,\s*["']([^"']*)["']\s*\)''', body)
+    if not assignments and not postback:
+        raise RuntimeError("无法从 deleteOnClick() 中解析回发字段，请改用 --backend playwright。")
+    for name, value in assignments:
+        data[name] = value
+    if postback:
+        data['__EVENTTARGET'], data['__EVENTARGUMENT'] = postback.groups()
+    return data
+
+
+async def delete_all_versions_over_http(session: aiohttp.ClientSession, url: str, timeout: float | None = None,
+                                        skip_clean: bool = False) -> bool:
+    """
+    通过 HTTP 完成与 deleteOnClick() 相同的“删除所有版本”操作：
+    GET versions.aspx 取得表单字段 (__VIEWSTATE、表单摘要等)，再 POST 回发。
+    timeout 为每个请求的超时 (秒)。失败时抛出异常。
+
+    skip_clean=True 时顺带检查同一个页面中的历史版本，只有当前版本则不提交回发 (不产生额外请求)；
+    未识别到版本列表时抛出异常，而不是当作没有历史版本跳过。
+
+    Returns:
+        提交了回发时为 True；因没有历史版本而跳过时为 False。
+    """
+    async with session.get(url, **request_timeout(timeout)) as response:
+        check_throttled(response.status, response.headers)
+        response.raise_for_status()
+        if 'login.microsoftonline.com' in str(response.url):
+            raise RuntimeError("Cookie 已失效，请求被重定向到登录页。请在浏览器中重新登录。")
+        html = await response.text()
+        parser = VersionsFormParser(str(response.url))
+        parser.feed(html)
+        parser.close()
+
+    if parser.form_action is None:
+        raise RuntimeError("versions.aspx 中未找到表单。")
+    if skip_clean:
+        history = VersionHistoryParser()
+        history.feed(html)
+        history.close()
+        if not history.summary()[0]:
+            return False
+
+    data = build_delete_all_postback(parser)
+    headers = {'Referer': url}
+    if '__REQUESTDIGEST' in data:
+        headers['X-RequestDigest'] = data['__REQUESTDIGEST']
+
+    async with session.post(parser.form_action, data=data, headers=headers, **request_timeout(timeout)) as response:
+        check_throttled(response.status, response.headers)
+        response.raise_for_status()
+        await response.read()
+    return True
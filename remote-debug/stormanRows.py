@@ -0,0 +1,123 @@
+import fnmatch
+import json
+import re
+from urllib.parse import urlsplit, parse_qs
+
+from pickk import LinkFilter, link_path
+
+FEATURE_LINK_TEXT = '版本历史记录'
+
+# storman.aspx 中显示的大小，如 "1.5 MB"、"120 KB"、"12 字节"
+SIZE_PATTERN = re.compile(r'^\s*([\d.,]+)\s*(B|KB|MB|GB|TB|字节)\s*$', re.IGNORECASE)
+SIZE_UNITS = {'b': 1, '字节': 1, 'kb': 1024, 'mb': 1024 ** 2, 'gb': 1024 ** 3, 'tb': 1024 ** 4}
+
+
+def parse_size(text: str) -> int | None:
+    """把 storman.aspx 显示的大小文本转换为字节数；不是大小文本时返回 None。"""
+    match = SIZE_PATTERN.match(text or '')
+    if not match:
+        return None
+    number = float(match.group(1).replace(',', ''))
+    return int(number * SIZE_UNITS[match.group(2).lower()])
+
+
+def make_row(url: str, cells: list[str]) -> dict:
+    """
+    把一行表格整理为记录：url、name (第 2 列文本，去掉“版本历史记录”)、cells (各列文本)
+    以及 sizes (依次出现的大小列，已转换为字节)。
+    """
+    cells = [cell.strip() for cell in cells]
+    name = cells[1].replace(FEATURE_LINK_TEXT, '').strip() if len(cells) > 1 else ''
+    sizes = [size for size in (parse_size(cell) for cell in cells) if size is not None]
+    return {'url': url, 'name': name, 'cells': cells, 'sizes': sizes}
+
+
+def format_size(size: int | None) -> str:
+    """把字节数格式化为便于阅读的文本。"""
+    if size is None:
+        return '未知'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}" if unit != 'B' else f"{size:.0f} B"
+        size /= 1024
+    return f"{size:.2f} TB"
+
+
+def folder_path(storman_url: str) -> str:
+    """storman.aspx 页面对应的文件夹路径 (root 参数，已解码)。"""
+    query = parse_qs(urlsplit(storman_url).query)
+    return query['root'][0] if 'root' in query else ''
+
+
+def file_path(row: dict, page_url: str) -> str:
+    """文件路径：versions.aspx 链接带 FileName 时用其路径，否则用“当前文件夹/文件名”。"""
+    path = link_path(row['url'])
+    if path == row['url'] or '://' in path:
+        path = f"{folder_path(page_url)}/{row['name']}"
+    return path
+
+
+def to_record(row: dict, page_url: str) -> dict:
+    """
+    “版本历史记录”行的结构化记录 (JSONL 输出格式)：
+    url、path、size (总大小，字节) 与 version_size (历史版本占用，字节；页面未显示时为 None)。
+    """
+    sizes = row['sizes']
+    return {
+        'url': row['url'],
+        'path': file_path(row, page_url),
+        'size': sizes[0] if sizes else None,
+        'version_size': sizes[1] if len(sizes) > 1 else None,
+    }
+
+
+def parse_link_line(line: str) -> dict:
+    """解析链接文件中的一行：JSONL 记录原样返回，纯文本链接返回 {'url': 链接}。"""
+    line = line.strip()
+    if line.startswith('{'):
+        return json.loads(line)
+    return {'url': line}
+
+
+def reclaimable_bytes(record: dict) -> int:
+    """
+    删除历史版本预计可释放的字节数。页面只有一个大小列 (没有 version_size) 时退回到总大小 size，
+    作为上限估计；两者都未知时为 0。
+    """
+    version_size = record.get('version_size')
+    return (version_size if version_size is not None else record.get('size')) or 0
+
+
+# --- 爬取时剪枝规则 ---
+class CrawlPruner:
+    """
+    在链接入队或写出之前判断是否需要访问/输出，使爬取时间与输出大小只取决于真正要清理的内容。
+
+    - skip_folders: 文件夹路径通配符 (fnmatch，不区分大小写)，匹配的文件夹连同其子树都不再访问。
+    - link_filter: pickk.LinkFilter，按扩展名 / 路径前缀 / 正则过滤文件。
+    - min_size: 行中显示的大小 (字节) 低于此值的文件不输出；行中没有大小时不按大小过滤。
+    """
+
+    def __init__(self, skip_folders=(), link_filter: LinkFilter | None = None, min_size: int = 0):
+        self.skip_folders = tuple(pattern.casefold() for pattern in skip_folders)
+        self.link_filter = link_filter
+        self.min_size = min_size
+        self.pruned_folders = 0
+        self.pruned_files = 0
+
+    def keep_folder(self, row: dict) -> bool:
+        path = folder_path(row['url']).casefold()
+        if any(fnmatch.fnmatchcase(path, pattern) for pattern in self.skip_folders):
+            self.pruned_folders += 1
+            return False
+        return True
+
+    def keep_file(self, row: dict, page_url: str) -> bool:
+        if self.link_filter is not None:
+            if not self.link_filter.should_keep_path(file_path(row, page_url)):
+                self.pruned_files += 1
+                return False
+        if self.min_size and row['sizes'] and row['sizes'][0] < self.min_size:
+            self.pruned_files += 1
+            return False
+        return True